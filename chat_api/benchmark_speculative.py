@@ -0,0 +1,89 @@
+import argparse
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+from generation import GenerationScheduler
+from load_test import PROMPTS, SAMPLING
+from speculative import DraftModelDrafter, PromptLookupDrafter
+
+# Tokens/sec and draft acceptance of speculative decoding against the old
+# generator(...) call and the plain scheduler, one request at a time on CPU
+# with small stand-in models (the draft must share the model's tokenizer):
+#
+#   python benchmark_speculative.py --model gpt2-medium --draft distilgpt2
+#
+# A greedy pass also checks that every drafter leaves the answers unchanged.
+
+
+def timed(ask, prompts, rounds):
+    tokens, start = 0, time.perf_counter()
+    for _ in range(rounds):
+        for prompt in prompts:
+            tokens += ask(prompt)
+    return tokens / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding")
+    parser.add_argument('--model', default="gpt2", help="Small local or hub model for CPU runs")
+    parser.add_argument('--draft', help="Draft model with the same tokenizer")
+    parser.add_argument('--draft-tokens', type=int, default=5, help="Tokens per step from the draft model")
+    parser.add_argument('--lookup-tokens', type=int, default=10, help="Tokens per step from prompt lookup")
+    parser.add_argument('--rounds', type=int, default=2, help="Passes over the prompts")
+    parser.add_argument('--skip-baseline', action='store_true')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    model.eval()
+
+    drafters = [('none', lambda: None), ('lookup', lambda: PromptLookupDrafter(args.lookup_tokens))]
+    if args.draft:
+        draft_model = AutoModelForCausalLM.from_pretrained(args.draft)
+        draft_model.eval()
+        drafters.append(('draft', lambda: DraftModelDrafter(draft_model, args.draft_tokens, SAMPLING['temperature'])))
+
+    print(f"{'mode':<10} {'tok/s':>8} {'speedup':>8} {'accept':>7} {'tok/step':>8} {'greedy_same':>11}")
+    baseline = None
+    if not args.skip_baseline:
+        generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+        def ask_generator(prompt):
+            # What flaskapp.py did before the scheduler
+            out = generator(prompt, return_full_text=False, do_sample=True, **SAMPLING)
+            return len(tokenizer(out[0]['generated_text'])['input_ids'])
+
+        baseline = timed(ask_generator, PROMPTS, args.rounds)
+        print(f"{'generator':<10} {baseline:>8.1f} {1.0:>8.2f} {'-':>7} {'-':>8} {'-':>11}")
+
+    reference = None
+    for name, make in drafters:
+        # Greedy answers must match the undrafted ones exactly
+        greedy = GenerationScheduler(model, tokenizer, max_batch=1, drafter=make(),
+                                     **dict(SAMPLING, temperature=0))
+        answers = [greedy.generate(prompt) for prompt in PROMPTS]
+        reference = reference or answers
+        same = sum(a == b for a, b in zip(answers, reference))
+
+        scheduler = GenerationScheduler(model, tokenizer, max_batch=1, drafter=make(), **SAMPLING)
+
+        def ask(prompt):
+            request = scheduler.submit_async(prompt)
+            request.wait()
+            return len(request.generated)
+
+        tps = timed(ask, PROMPTS, args.rounds)
+        accept = scheduler.tokens_accepted / scheduler.tokens_drafted if scheduler.tokens_drafted else 0.0
+        per_step = scheduler.tokens_generated / max(scheduler.steps + len(PROMPTS) * args.rounds, 1)
+        # Against generator(...), or the undrafted scheduler with --skip-baseline
+        baseline = baseline or tps
+        speedup = tps / baseline
+        print(f"{name:<10} {tps:>8.1f} {speedup:>8.2f} {accept:>7.2f} {per_step:>8.2f} "
+              f"{f'{same}/{len(PROMPTS)}':>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+
+
+def render_turn(user, assistant):
+    # The answer follows the question exactly as the model generated it, so
+    # the transcript re-tokenizes to the ids already in the cache
+    return f"{user}{assistant}\n\n"
+
+
+class ConversationContext:
+    # Recent turns of one conversation plus the model's key/value cache for
+    # the token ids it last processed. A follow-up prompt starts with the
+    # same transcript, so only the tokens after the shared prefix need a
+    # forward pass.
+    def __init__(self, conversation_id, store):
+        self.conversation_id = conversation_id
+        self.store = store
+        self.turns = []
+        self.turn_tokens = []
+        self.cached_ids = []
+        self.cache = None
+        self.nbytes = 0
+
+    def has_history(self):
+        return bool(self.turns)
+
+    def encode(self, tokenizer, message):
+        # Called on the generation worker, which owns the tokenizer. Keeps
+        # the newest turns that fit the token budget together with the new
+        # message; returns (prompt_ids, tokens in the message alone).
+        with self.store.lock:
+            turns = list(self.turns)
+            counts = list(self.turn_tokens)
+        message_len = len(tokenizer(message)['input_ids'])
+
+        for i in range(len(counts), len(turns)):
+            counts.append(len(tokenizer(render_turn(*turns[i]))['input_ids']))
+        with self.store.lock:
+            if len(self.turns) == len(turns):
+                self.turn_tokens = counts
+
+        budget = self.store.max_prompt_tokens - message_len
+        keep = 0
+        for count in reversed(counts):
+            if count > budget:
+                break
+            budget -= count
+            keep += 1
+        kept = turns[len(turns) - keep:] if keep else []
+        prompt = "".join(render_turn(u, a) for u, a in kept) + message
+        return tokenizer(prompt)['input_ids'], message_len
+
+    def reusable(self, prompt_ids):
+        # Longest cached prefix of prompt_ids, always leaving at least one
+        # token to run so the model produces logits for the next one.
+        with self.store.lock:
+            if self.cache is None:
+                return 0, None
+            limit = min(len(self.cached_ids), len(prompt_ids) - 1)
+            n = 0
+            while n < limit and self.cached_ids[n] == prompt_ids[n]:
+                n += 1
+            if n == 0:
+                return 0, None
+            self.store._touch(self)
+            return n, tuple((k[:, :, :n], v[:, :, :n]) for k, v in self.cache)
+
+    def save(self, ids, cache):
+        # Own copies, so a batch-wide decode tensor isn't kept alive
+        cache = tuple((k.clone(), v.clone()) for k, v in cache)
+        nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in cache)
+        with self.store.lock:
+            self.cached_ids = list(ids)
+            self.cache = cache
+            self.store._resize(self, nbytes)
+
+    def drop_cache(self):
+        self.cached_ids = []
+        self.cache = None
+
+
+class ConversationStore:
+    # Conversation contexts by id, LRU on both ends: at most
+    # max_conversations are remembered, and KV caches are released, least
+    # recently used first, once together they exceed max_cache_bytes.
+    def __init__(self, max_conversations=1000, max_turns=20, max_prompt_tokens=1024,
+                 max_cache_bytes=512 * 1024 * 1024):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_cache_bytes = max_cache_bytes
+        self.cache_bytes = 0
+        self.lock = threading.RLock()
+        self._contexts = OrderedDict()
+
+    def get(self, conversation_id):
+        with self.lock:
+            context = self._contexts.get(conversation_id)
+            if context is None:
+                context = ConversationContext(conversation_id, self)
+                self._contexts[conversation_id] = context
+                while len(self._contexts) > self.max_conversations:
+                    _, old = self._contexts.popitem(last=False)
+                    self._resize(old, 0)
+            self._touch(context)
+            return context
+
+    def record_turn(self, context, message, response):
+        with self.lock:
+            context.turns.append((message, response))
+            if len(context.turns) > self.max_turns:
+                drop = len(context.turns) - self.max_turns
+                del context.turns[:drop]
+                del context.turn_tokens[:drop]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'conversations': len(self._contexts),
+                'cached': sum(1 for c in self._contexts.values() if c.cache is not None),
+                'cache_bytes': self.cache_bytes,
+            }
+
+    def _touch(self, context):
+        if context.conversation_id in self._contexts:
+            self._contexts.move_to_end(context.conversation_id)
+
+    def _resize(self, context, nbytes):
+        self.cache_bytes += nbytes - context.nbytes
+        context.nbytes = nbytes
+        if nbytes == 0:
+            context.drop_cache()
+        self._touch(context)
+        for other in list(self._contexts.values()):
+            if self.cache_bytes <= self.max_cache_bytes:
+                break
+            if other is not context and other.cache is not None:
+                self._resize(other, 0)
+        if self.cache_bytes > self.max_cache_bytes and context.cache is not None:
+            # A single cache over budget isn't worth keeping
+            self._resize(context, 0)
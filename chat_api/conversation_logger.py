@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+# Writes per logged turn
+TURN_WRITES = 4
+
+
+class ConversationLogger:
+    # Write-behind logging of chat turns. log_turn() only enqueues; a
+    # background thread group-commits queued turns as one Firestore batch
+    # once max_batch writes are waiting, flush_interval seconds have passed,
+    # or flush() is called. Each turn is four blind merge/set writes (no
+    # existence read) and never split across batches. Failed commits are
+    # retried with exponential backoff; a batch that still fails gets one
+    # more try per turn, so one bad turn doesn't lose the others.
+    def __init__(self, db, max_batch=200, flush_interval=1.0, max_pending=5000,
+                 max_retries=5, backoff=0.5):
+        self.db = db
+        # At least one whole turn, or nothing would ever fit a batch
+        self.max_batch = max(min(max_batch, FIRESTORE_BATCH_LIMIT), TURN_WRITES)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.committed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._turns = deque()
+        self._pending_writes = 0
+        self._enqueued = 0
+        self._processed = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="conversation-logger", daemon=True)
+        self._thread.start()
+
+    def log_turn(self, user_id, message, response, conversation_id, asked_at=None):
+        answered_at = datetime.now(timezone.utc)
+        conversation_ref = self.db.collection('conversations').document(conversation_id)
+        messages_ref = conversation_ref.collection('messages')
+        writes = [
+            (self.db.collection('users').document(user_id),
+             {'last_active': firestore.SERVER_TIMESTAMP}, True),
+            (conversation_ref,
+             {'user_id': user_id, 'updated_at': firestore.SERVER_TIMESTAMP}, True),
+            # Both messages share the commit's server timestamp; sent_at
+            # keeps them in order
+            (messages_ref.document(),
+             {'content': message, 'sender': 'user', 'timestamp': firestore.SERVER_TIMESTAMP,
+              'sent_at': asked_at or answered_at}, False),
+            (messages_ref.document(),
+             {'content': response, 'sender': 'assistant', 'timestamp': firestore.SERVER_TIMESTAMP,
+              'sent_at': answered_at}, False),
+        ]
+        with self._cond:
+            if self._closed or self._pending_writes + len(writes) > self.max_pending:
+                # Never hold up a chat response for logging
+                self.dropped += 1
+                print(f"Conversation log queue full, dropping turn for {conversation_id}")
+                return False
+            self._turns.append(writes)
+            self._pending_writes += len(writes)
+            self._enqueued += 1
+            if self._pending_writes >= self.max_batch:
+                self._cond.notify_all()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._turns)
+
+    def flush(self, wait=False, timeout=None):
+        with self._cond:
+            target = self._enqueued
+            self._flush_requested = True
+            self._cond.notify_all()
+            if wait:
+                return self._cond.wait_for(lambda: self._processed >= target, timeout)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(wait=True, timeout=timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closed and not self._flush_requested and self._pending_writes < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            turns, size = [], 0
+            while self._turns and size + len(self._turns[0]) <= self.max_batch:
+                writes = self._turns.popleft()
+                turns.append(writes)
+                size += len(writes)
+            self._pending_writes -= size
+            if not self._turns:
+                self._flush_requested = False
+            if not turns and self._closed:
+                return None
+            return turns
+
+    def _commit(self, turns):
+        error = self._write(turns, self.max_retries)
+        if error is not None and len(turns) > 1:
+            for writes in turns:
+                self._count(self._write([writes], 0), 1)
+        else:
+            self._count(error, len(turns))
+
+    def _count(self, error, turns):
+        if error is None:
+            self.committed += turns
+        else:
+            self.failed += turns
+            print(f"خطأ في تسجيل المحادثة: {str(error)}")
+
+    def _write(self, turns, retries):
+        # Returns None on success, else the last error
+        for attempt in range(retries + 1):
+            try:
+                batch = self.db.batch()
+                for writes in turns:
+                    for ref, data, merge in writes:
+                        batch.set(ref, data, merge=merge)
+                batch.commit()
+                return None
+            except Exception as e:
+                if attempt == retries:
+                    return e
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _run(self):
+        while True:
+            turns = self._next_batch()
+            if turns is None:
+                return
+            if turns:
+                self._commit(turns)
+            with self._cond:
+                self._processed += len(turns)
+                self._cond.notify_all()
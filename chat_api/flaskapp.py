@@ -1,15 +1,23 @@
-from flask import Flask, request, jsonify
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, pipeline
+from flask import Flask, Response, request, jsonify
 import firebase_admin
 from firebase_admin import credentials, firestore
 import uuid
-import re
 from flask_cors import CORS
 import time
 import os
 import random
+import queue
+import json
+import atexit
+from datetime import datetime, timezone
 from firebase_admin import credentials, firestore
+from response_cache import ResponseCache, sentence_transformer_embedder
+from conversation_context import ConversationStore
+from conversation_logger import ConversationLogger
+from model_registry import ModelNotReady, ModelRegistry
+from metrics import (first_token_seconds, gauge, observe_generation, render as render_metrics,
+                     request_seconds, stage_seconds)
+from profiler import SamplingProfiler
 app = Flask(__name__)
 CORS(app) 
 
@@ -21,27 +29,83 @@ cred = credentials.Certificate('./firebase-cardential/')
 firebase_admin.initialize_app(cred)
 db = firestore.client()
 # model downloading
-print("جاري تحميل الموديل...")
 model_path = r"Final-project\Chatbot\full_model"  
 
-quantization_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_compute_dtype=torch.float16,
-    bnb_4bit_quant_type="nf4"
-)
+# torch and transformers are imported by the background loader below, so
+# the server starts answering /health before they are loaded
+
+# CHAT_SPECULATIVE=1 turns on speculative decoding: a small draft model
+# (CHAT_DRAFT_MODEL, same tokenizer as the chat model) or, without one,
+# n-gram prompt lookup proposes CHAT_DRAFT_TOKENS tokens per step that the
+# chat model verifies in one forward pass. Answers are sampled from the same
+# distribution either way.
+def make_drafter():
+    if os.environ.get("CHAT_SPECULATIVE", "0") != "1":
+        return None
+    from speculative import DraftModelDrafter, PromptLookupDrafter
+    draft_path = os.environ.get("CHAT_DRAFT_MODEL")
+    if draft_path:
+        from transformers import AutoModelForCausalLM
+        draft_model = AutoModelForCausalLM.from_pretrained(draft_path, device_map="auto")
+        draft_model.eval()
+        return DraftModelDrafter(draft_model, num_tokens=int(os.environ.get("CHAT_DRAFT_TOKENS", 5)), temperature=0.7)
+    return PromptLookupDrafter(num_tokens=int(os.environ.get("CHAT_DRAFT_TOKENS", 10)))
+
+def load_chat_model():
+    print("جاري تحميل الموديل...")
+    try:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+        from generation import GenerationScheduler
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_compute_dtype=torch.float16,
+            bnb_4bit_quant_type="nf4"
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            quantization_config=quantization_config,
+            device_map="auto"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        # Concurrent chats share one continuously batched decode loop
+        scheduler = GenerationScheduler(
+            model,
+            tokenizer,
+            max_batch=int(os.environ.get("CHAT_BATCH_MAX", 8)),
+            max_length=200,
+            temperature=0.7,
+            top_p=0.9,
+            repetition_penalty=1.1,
+            drafter=make_drafter()
+        )
+        print("✅ تم تحميل الموديل بنجاح")
+        return scheduler
+    except Exception as e:
+        print(f"❌ خطأ أثناء تحميل الموديل: {str(e)}")
+        raise
+
+def warm_chat_model(scheduler):
+    # One forward pass loads the CUDA kernels before the first real chat;
+    # no request can reach the scheduler until this returns
+    import torch
+    with torch.inference_mode():
+        input_ids = torch.tensor([scheduler.tokenizer("Hello")['input_ids']], device=scheduler.device)
+        scheduler.model(input_ids=input_ids)
 
-try:
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        quantization_config=quantization_config,
-        device_map="auto"
-    )
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
-    print("✅ تم تحميل الموديل بنجاح")
-except Exception as e:
-    print(f"❌ خطأ أثناء تحميل الموديل: {str(e)}")
-    generator = None
+# The model loads in the background after the server starts, so /health
+# answers right away and /ready turns 200 once it is loaded and warmed up
+# (CHAT_WARMUP=0 skips the warmup). Chats that need the model before then
+# wait up to CHAT_MODEL_WAIT seconds, then get a 503.
+models = ModelRegistry(warmup=os.environ.get("CHAT_WARMUP", "1") == "1")
+models.register('chat', load_chat_model, warmup=warm_chat_model)
+model_wait = float(os.environ.get("CHAT_MODEL_WAIT", 0))
+
+def get_scheduler():
+    # None if loading failed; raises ModelNotReady while it is still loading
+    if models.state('chat') == 'failed':
+        return None
+    return models.get('chat', timeout=model_wait)
 
 
 GREETING_PATTERNS = [
@@ -58,50 +122,65 @@ GREETING_RESPONSES = [
 ]
 
 
-def is_greeting(message):
-    return any(re.search(pattern, message, re.IGNORECASE) for pattern in GREETING_PATTERNS)
-
 def get_greeting_response():
     return random.choice(GREETING_RESPONSES)
 
+# Repeated questions skip generation: greetings are a static tier, then
+# exact matches on the normalized message, then (if CHAT_SEMANTIC_CACHE_MODEL
+# names a sentence-transformers model) near-duplicates by embedding
+semantic_model = os.environ.get("CHAT_SEMANTIC_CACHE_MODEL")
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("CHAT_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("CHAT_CACHE_TTL", 3600)),
+    static_rules=[(GREETING_PATTERNS, get_greeting_response)],
+    embed=sentence_transformer_embedder(semantic_model) if semantic_model else None,
+    similarity=float(os.environ.get("CHAT_SEMANTIC_THRESHOLD", 0.9))
+)
+
+# Recent turns per conversation_id go into the prompt, up to
+# CHAT_CONTEXT_TOKENS; the model's key/value cache for each transcript is
+# kept (LRU, CHAT_KV_CACHE_MB in total) so a follow-up only runs its new
+# tokens through the model
+conversations = ConversationStore(
+    max_conversations=int(os.environ.get("CHAT_MAX_CONVERSATIONS", 1000)),
+    max_turns=int(os.environ.get("CHAT_CONTEXT_TURNS", 20)),
+    max_prompt_tokens=int(os.environ.get("CHAT_CONTEXT_TOKENS", 1024)),
+    max_cache_bytes=int(os.environ.get("CHAT_KV_CACHE_MB", 512)) * 1024 * 1024
+)
+
 def clean_model_response(original_message, response):
     if response.startswith(original_message):
         response = response[len(original_message):].strip()
     return response
 
-def log_to_firebase(user_id, message, response, conversation_id):
-    try:
-        user_ref = db.collection('users').document(user_id)
-        if not user_ref.get().exists:
-            user_ref.set({
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'last_active': firestore.SERVER_TIMESTAMP
-            })
-        else:
-            user_ref.update({'last_active': firestore.SERVER_TIMESTAMP})
-        
-        conversation_ref = db.collection('conversations').document(conversation_id)
-        conversation_ref.set({
-            'user_id': user_id,
-            'updated_at': firestore.SERVER_TIMESTAMP
-        }, merge=True)
-        
-        messages_ref = conversation_ref.collection('messages')
-        messages_ref.add({
-            'content': message,
-            'sender': 'user',
-            'timestamp': firestore.SERVER_TIMESTAMP
-        })
-        messages_ref.add({
-            'content': response,
-            'sender': 'assistant',
-            'timestamp': firestore.SERVER_TIMESTAMP
-        })
-        
-        return True
-    except Exception as e:
-        print(f"خطأ في تسجيل المحادثة: {str(e)}")
-        return False
+# Chat turns are logged write-behind: one batched commit for many turns,
+# off the request path, flushed when the process exits
+conversation_logger = ConversationLogger(
+    db,
+    max_batch=int(os.environ.get("CHAT_LOG_BATCH", 200)),
+    flush_interval=float(os.environ.get("CHAT_LOG_INTERVAL", 1.0))
+)
+atexit.register(conversation_logger.close)
+
+def log_to_firebase(user_id, message, response, conversation_id, asked_at=None):
+    return conversation_logger.log_turn(user_id, message, response, conversation_id, asked_at)
+
+def scheduler_gauge(read):
+    # 0 until the model has loaded
+    return lambda: read(models.get('chat')) if models.state('chat') == 'ready' else 0
+
+# Queue depths and in-flight work, sampled on each /metrics scrape
+gauge('chat_queue_depth', "Prompts waiting for a batch slot", scheduler_gauge(lambda s: s.queue_depth()))
+gauge('chat_in_flight', "Prompts decoding in the running batch", scheduler_gauge(lambda s: s.in_flight()))
+gauge('chat_draft_acceptance', "Share of drafted tokens the chat model accepted",
+      scheduler_gauge(lambda s: s.tokens_accepted / s.tokens_drafted if s.tokens_drafted else 0))
+gauge('chat_log_queue_depth', "Chat turns waiting to be written to Firestore", conversation_logger.pending)
+gauge('chat_kv_cache_bytes', "Key/value cache kept for conversations", lambda: conversations.cache_bytes)
+gauge('chat_model_ready', "1 once the chat model is loaded", models.is_ready)
+
+# Sampling profiler for a live server, off unless CHAT_PROFILER=1
+profiler = SamplingProfiler()
+profiler_enabled = os.environ.get("CHAT_PROFILER", "0") == "1"
 
 # API الرئيسي
 @app.route('/api/chat', methods=['POST'])
@@ -118,26 +197,41 @@ def chat():
     #     return jsonify({"error": "رسالتك طويلة جدًا. أقصى طول مسموح به هو 500 حرف."}), 400
 
     start_time = time.time()
+    asked_at = datetime.now(timezone.utc)
 
     try:
-        if is_greeting(message):
-            response = get_greeting_response()
-        elif generator:
-            outputs = generator(
-                message,
-                max_length=200,
-                temperature=0.7,
-                top_p=0.9,
-                repetition_penalty=1.1
-            )
-            response = clean_model_response(message, outputs[0]['generated_text'])
-        else:
+        context = conversations.get(conversation_id)
+        history = context.has_history()
+        # Only a first message can share an answer with other users
+        lookup_start = time.perf_counter()
+        response, source = response_cache.lookup(message, static_only=history)
+        stage_seconds.labels('cache').observe(time.perf_counter() - lookup_start)
+        scheduler = get_scheduler() if response is None else None
+        raw = response
+        if response is None and scheduler:
+            pending = scheduler.submit_async(message, context=context)
+            raw = pending.wait()
+            observe_generation(pending)
+            if pending.first_token_at is not None:
+                first_token_seconds.labels('chat').observe(pending.first_token_at - pending.submitted_at)
+            source = 'model'
+            response = clean_model_response(message, raw)
+            if not history:
+                response_cache.store(message, response)
+        elif response is None:
             response = "I'm sorry, the AI model is currently unavailable. Please try again later."
+            raw = None
+            source = 'unavailable'
+        if raw is not None:
+            conversations.record_turn(context, message, raw)
 
-        log_to_firebase(user_id, message, response, conversation_id)
+        log_start = time.perf_counter()
+        log_to_firebase(user_id, message, response, conversation_id, asked_at)
+        stage_seconds.labels('log').observe(time.perf_counter() - log_start)
 
         end_time = time.time()
         response_time = end_time - start_time
+        request_seconds.labels('chat', source).observe(response_time)
 
         return jsonify({
             "response": response,
@@ -145,6 +239,10 @@ def chat():
             "response_time": response_time
         })
 
+    except queue.Full:
+        return jsonify({"error": "الخادم مشغول حاليًا، حاول مرة أخرى بعد قليل"}), 503
+    except ModelNotReady:
+        return jsonify({"error": "الموديل قيد التحميل، حاول مرة أخرى بعد قليل"}), 503, {"Retry-After": "5"}
     except Exception as e:
         print(f"خطأ عام: {str(e)}")
         return jsonify({
@@ -152,5 +250,182 @@ def chat():
             "details": str(e)
         }), 500
 
+def sse_event(payload, event=None):
+    lines = f"event: {event}\n" if event else ""
+    return lines + f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# نسخة البث: ترجع التوكنز أول بأول (Server-Sent Events)
+# Emits {"token": ...} events as the answer decodes, then a "done" event
+# with the full response and response_time split into time_to_first_token
+# and total.
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    user_id = data.get('user_id')
+    message = data.get('message')
+    conversation_id = data.get('conversation_id', str(uuid.uuid4()))
+
+    if not user_id or not message:
+        return jsonify({"error": "user_id و message مطلوبين"}), 400
+
+    start_time = time.time()
+    asked_at = datetime.now(timezone.utc)
+    pieces = queue.Queue()
+
+    # Everything before the stream starts fails like /api/chat
+    try:
+        context = conversations.get(conversation_id)
+        history = context.has_history()
+        lookup_start = time.perf_counter()
+        cached, source = response_cache.lookup(message, static_only=history)
+        stage_seconds.labels('cache').observe(time.perf_counter() - lookup_start)
+        scheduler = get_scheduler() if cached is None else None
+        if cached is not None:
+            pending = None
+            pieces.put(cached)
+        elif scheduler:
+            pending = scheduler.submit_async(message, on_token=pieces.put, context=context)
+            source = 'model'
+        else:
+            pending = None
+            source = 'unavailable'
+            pieces.put("I'm sorry, the AI model is currently unavailable. Please try again later.")
+    except queue.Full:
+        return jsonify({"error": "الخادم مشغول حاليًا، حاول مرة أخرى بعد قليل"}), 503
+    except ModelNotReady:
+        return jsonify({"error": "الموديل قيد التحميل، حاول مرة أخرى بعد قليل"}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        print(f"خطأ عام: {str(e)}")
+        return jsonify({
+            "error": "حدث خطأ أثناء معالجة طلبك",
+            "details": str(e)
+        }), 500
+
+    def generate():
+        first_token_time = None
+        streamed = []
+        answered = False
+        try:
+            while True:
+                try:
+                    piece = pieces.get(timeout=0.05)
+                except queue.Empty:
+                    if pending is None or pending.done.is_set():
+                        if pieces.empty():
+                            break
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                streamed.append(piece)
+                yield sse_event({"token": piece})
+
+            if pending is not None and pending.error is not None:
+                print(f"خطأ عام: {str(pending.error)}")
+                yield sse_event({"error": "حدث خطأ أثناء معالجة طلبك", "details": str(pending.error)}, event="error")
+                return
+
+            answered = True
+            if pending is not None:
+                observe_generation(pending)
+            if first_token_time is not None:
+                first_token_seconds.labels('stream').observe(first_token_time)
+
+            raw = "".join(streamed)
+            response = clean_model_response(message, raw)
+            if pending is not None or cached is not None:
+                conversations.record_turn(context, message, raw)
+            if pending is not None and not history:
+                response_cache.store(message, response)
+            total = time.time() - start_time
+            request_seconds.labels('stream', source).observe(total)
+
+            log_start = time.perf_counter()
+            log_to_firebase(user_id, message, response, conversation_id, asked_at)
+            stage_seconds.labels('log').observe(time.perf_counter() - log_start)
+
+            yield sse_event({
+                "response": response,
+                "conversation_id": conversation_id,
+                "response_time": {
+                    "time_to_first_token": first_token_time,
+                    "total": total
+                }
+            }, event="done")
+        finally:
+            # A client that disconnects mid-answer (GeneratorExit) takes its
+            # request out of the shared batch; the part it already received
+            # is still recorded and logged
+            if pending is not None:
+                pending.cancel()
+            if not answered and streamed and (pending is None or pending.error is None):
+                raw = "".join(streamed)
+                conversations.record_turn(context, message, raw)
+                log_to_firebase(user_id, message, clean_model_response(message, raw), conversation_id, asked_at)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = response_cache.stats()
+    stats['conversations'] = conversations.stats()
+    return jsonify(stats)
+
+# Prometheus scrape endpoint: per-stage latency histograms, token
+# counters, queue depth gauges
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+# Runtime profiler control: POST {"action": "start" | "stop" | "reset",
+# "interval": seconds}; GET returns collapsed stacks for a flame graph
+# (?format=json for the profiler status)
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    if not profiler_enabled:
+        return jsonify({"error": "أداة التحليل غير مفعلة"}), 404
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            interval = data.get('interval')
+            if interval is not None:
+                # A bad interval would kill the sampler thread, not this request
+                try:
+                    interval = float(interval)
+                except (TypeError, ValueError):
+                    interval = 0.0
+                if not 0 < interval < float('inf'):
+                    return jsonify({"error": "فترة أخذ العينات غير صالحة"}), 400
+            profiler.start(interval)
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({"error": "إجراء غير صالح"}), 400
+        return jsonify(profiler.status())
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.status())
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+# Liveness: the process is up and serving requests
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"})
+
+# Readiness: the model is loaded and warmed up
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = models.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+# Under the debug reloader only the serving child process loads the model
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    models.start()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=4040)
@@ -0,0 +1,375 @@
+import queue
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+
+class GenerationRequest:
+    def __init__(self, prompt, on_token=None, context=None):
+        self.prompt = prompt
+        self.context = context
+        self.max_new_tokens = None
+        self.reused_tokens = 0
+        self.prompt_ids = None
+        self.generated = []
+        self.on_token = on_token
+        self.cache = None
+        self.cache_len = 0
+        self.draft_state = None
+        self.drafted = 0
+        self.accepted = 0
+        self.next_token = None
+        self.emitted = ""
+        self.text = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.tokenized_at = None
+        self.prefilled_at = None
+        self.first_token_at = None
+        self.finished_at = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("Generation timed out")
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def cancel(self):
+        # The scheduler retires the request before its next decode step;
+        # text keeps whatever was generated so far
+        self.cancelled = True
+
+
+class GenerationScheduler:
+    # Continuous batching in front of a causal LM. Prompts queue up and one
+    # worker thread runs a shared decode loop: between decode steps it
+    # prefills newly arrived prompts into the running batch and retires
+    # finished ones, so short answers never wait for long ones and
+    # concurrent users share every forward pass.
+    #
+    # Sampling mirrors the generator(...) call in flaskapp.py: temperature,
+    # top_p, repetition_penalty and max_length counted over prompt + answer.
+    # With a ConversationContext the prompt is the recent transcript, the
+    # answer keeps the budget the bare message would have had, and cached
+    # keys/values of the shared transcript prefix are reused.
+    #
+    # With a drafter (see speculative.py) every decode step also verifies
+    # the tokens it drafted for each request in the same forward pass and
+    # keeps those that speculative sampling accepts.
+    def __init__(self, model, tokenizer, max_batch=8, max_length=200, temperature=0.7,
+                 top_p=0.9, repetition_penalty=1.1, max_queue=256, drafter=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self.max_length = max_length
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.drafter = drafter
+        self.device = next(model.parameters()).device
+
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) - {None}
+
+        self.steps = 0
+        self.tokens_generated = 0
+        self.tokens_drafted = 0
+        self.tokens_accepted = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._active = []
+        self._cache_objects = True
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit_async(self, prompt, on_token=None, context=None):
+        # on_token(text_piece) is called from the worker as tokens decode
+        request = GenerationRequest(prompt, on_token, context)
+        self._queue.put_nowait(request)
+        return request
+
+    def generate(self, prompt, timeout=None, context=None):
+        return self.submit_async(prompt, context=context).wait(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def in_flight(self):
+        return len(self._active)
+
+    def _admit(self):
+        # Block only when there is nothing to decode
+        block = not self._active
+        while len(self._active) < self.max_batch:
+            try:
+                request = self._queue.get(block=block)
+            except queue.Empty:
+                return
+            block = False
+            if request.cancelled:
+                self._finish(request)
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                self._finish(request, error=e)
+                continue
+            if not request.done.is_set():
+                self._active.append(request)
+
+    def _prefill(self, request):
+        # Tokenized here so only the worker thread ever uses the tokenizer
+        request.started_at = time.perf_counter()
+        prefix, past = 0, None
+        if request.context is not None:
+            request.prompt_ids, message_len = request.context.encode(self.tokenizer, request.prompt)
+            request.max_new_tokens = max(1, self.max_length - message_len)
+            prefix, past = request.context.reusable(request.prompt_ids)
+        else:
+            request.prompt_ids = self.tokenizer(request.prompt)['input_ids']
+        request.reused_tokens = prefix
+        request.tokenized_at = time.perf_counter()
+
+        input_ids = torch.tensor([request.prompt_ids[prefix:]], device=self.device)
+        if past is None:
+            out = self.model(input_ids=input_ids, use_cache=True)
+        else:
+            past = tuple((k.to(self.device), v.to(self.device)) for k, v in past)
+            out = self.model(
+                input_ids=input_ids,
+                position_ids=torch.arange(prefix, len(request.prompt_ids), device=self.device).unsqueeze(0),
+                past_key_values=DynamicCache.from_legacy_cache(past) if self._cache_objects else past,
+                use_cache=True,
+            )
+        # Hand caches back in whichever format the model produced
+        self._cache_objects = hasattr(out.past_key_values, 'to_legacy_cache')
+        request.cache = self._to_legacy(out.past_key_values)
+        request.cache_len = len(request.prompt_ids)
+        request.prefilled_at = time.perf_counter()
+        self._accept(request, self._sample(out.logits[0, -1], request))
+
+    def _decode_step(self):
+        active = self._active
+        max_len = max(r.cache_len for r in active)
+
+        # Left-pad every request's cache to a common length and stack them
+        past = []
+        for layer in range(len(active[0].cache)):
+            keys, values = [], []
+            for r in active:
+                k, v = r.cache[layer]
+                pad = max_len - k.shape[2]
+                if pad:
+                    k = F.pad(k, (0, 0, pad, 0))
+                    v = F.pad(v, (0, 0, pad, 0))
+                keys.append(k)
+                values.append(v)
+            past.append((torch.cat(keys), torch.cat(values)))
+
+        # Each row feeds its last token plus its drafts, right-padded to a
+        # common width; causal attention keeps the padding out of real rows
+        drafts = [self._draft(r) for r in active]
+        width = 1 + max(len(tokens) for tokens, _ in drafts)
+        attention_mask = torch.zeros((len(active), max_len + width), dtype=torch.long, device=self.device)
+        for i, r in enumerate(active):
+            attention_mask[i, max_len - r.cache_len:] = 1
+        input_ids = torch.tensor(
+            [[r.next_token] + tokens + [r.next_token] * (width - 1 - len(tokens))
+             for r, (tokens, _) in zip(active, drafts)], device=self.device)
+        position_ids = torch.tensor(
+            [list(range(r.cache_len, r.cache_len + width)) for r in active], device=self.device)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache.from_legacy_cache(tuple(past)) if self._cache_objects else tuple(past),
+            use_cache=True,
+        )
+        new_past = self._to_legacy(out.past_key_values)
+        self.steps += 1
+
+        for i, r in enumerate(active):
+            tokens, probs = drafts[i]
+            if tokens:
+                accepted, token = self._verify(out.logits[i], r, tokens, probs)
+            else:
+                accepted, token = [], self._sample(out.logits[i, 0], r)
+            # Keep the cache for the fed token and the accepted drafts
+            start = max_len - r.cache_len
+            end = max_len + 1 + len(accepted)
+            r.cache = tuple((k[i:i + 1, :, start:end], v[i:i + 1, :, start:end]) for k, v in new_past)
+            r.cache_len += 1 + len(accepted)
+            if self.drafter is not None:
+                self.drafter.rewind(r, len(r.prompt_ids) + len(r.generated) + len(accepted))
+            for t in accepted + [token]:
+                if r.done.is_set():
+                    break
+                self._accept(r, t)
+
+    def _draft(self, request):
+        # Drafts stop one short of the token budget: the verify step always
+        # adds one token of its own
+        if self.drafter is None:
+            return [], None
+        if request.max_new_tokens is not None:
+            budget = request.max_new_tokens - len(request.generated)
+        else:
+            budget = self.max_length - len(request.prompt_ids) - len(request.generated)
+        if budget <= 1:
+            return [], None
+        try:
+            tokens, probs = self.drafter.propose(request, budget - 1)
+        except Exception as e:
+            print(f"Error drafting tokens: {e}")
+            return [], None
+        request.drafted += len(tokens)
+        self.tokens_drafted += len(tokens)
+        return tokens, probs
+
+    def _verify(self, logits, request, tokens, probs):
+        # Speculative sampling (Leviathan et al. 2023, Chen et al. 2023):
+        # draft token d drawn from q is kept with probability
+        # min(1, p(d) / q(d)), where p is this scheduler's sampling
+        # distribution at that position; the first rejected position draws
+        # from max(0, p - q) instead, and if every draft is kept one more
+        # token comes from p. The result is distributed exactly as p.
+        # Deterministic drafts (probs None) have q one-hot on d.
+        history = request.prompt_ids + request.generated
+        accepted = []
+        for j, token in enumerate(tokens):
+            p = self._distribution(logits[j], history + accepted)
+            q = None if probs is None else probs[j].to(p.device)
+            p_token = float(p[token]) if token < len(p) else 0.0
+            q_token = 1.0 if q is None else (float(q[token]) if token < len(q) else 0.0)
+            if p_token > 0 and (p_token >= q_token or float(torch.rand(())) < p_token / q_token):
+                if token in self.eos_ids:
+                    self._record_acceptance(request, accepted)
+                    return accepted, token
+                accepted.append(token)
+                continue
+            residual = p.clone()
+            if q is None:
+                residual[token] = 0
+            else:
+                n = min(len(p), len(q))
+                residual[:n] = (p[:n] - q[:n]).clamp(min=0)
+            if residual.sum() <= 0:
+                residual = p
+            self._record_acceptance(request, accepted)
+            return accepted, self._pick(residual / residual.sum())
+        self._record_acceptance(request, accepted)
+        return accepted, self._pick(self._distribution(logits[len(tokens)], history + accepted))
+
+    def _record_acceptance(self, request, accepted):
+        request.accepted += len(accepted)
+        self.tokens_accepted += len(accepted)
+
+    def _to_legacy(self, cache):
+        return cache.to_legacy_cache() if hasattr(cache, 'to_legacy_cache') else cache
+
+    def _sample(self, logits, request):
+        return self._pick(self._distribution(logits, request.prompt_ids + request.generated))
+
+    def _distribution(self, logits, history):
+        # Next-token probabilities after repetition penalty over `history`,
+        # temperature and top_p; one-hot on the argmax when greedy
+        logits = logits.float().clone()
+        if self.repetition_penalty != 1.0:
+            seen = torch.tensor(history, device=logits.device).unique()
+            scores = logits[seen]
+            logits[seen] = torch.where(scores < 0, scores * self.repetition_penalty, scores / self.repetition_penalty)
+        if not self.temperature:
+            probs = torch.zeros_like(logits)
+            probs[torch.argmax(logits)] = 1
+            return probs
+
+        probs = torch.softmax(logits / self.temperature, dim=-1)
+        if self.top_p < 1.0:
+            sorted_probs, order = torch.sort(probs, descending=True)
+            outside = torch.cumsum(sorted_probs, dim=-1) - sorted_probs > self.top_p
+            sorted_probs[outside] = 0
+            probs = torch.zeros_like(probs).scatter(0, order, sorted_probs)
+        return probs / probs.sum()
+
+    def _pick(self, probs):
+        if not self.temperature:
+            return int(torch.argmax(probs))
+        return int(torch.multinomial(probs, 1))
+
+    def _accept(self, request, token):
+        if token in self.eos_ids:
+            self._finish(request)
+            return
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        request.generated.append(token)
+        request.next_token = token
+        self.tokens_generated += 1
+        if request.on_token is not None:
+            self._emit(request)
+        if request.max_new_tokens is not None:
+            if len(request.generated) >= request.max_new_tokens:
+                self._finish(request)
+        elif len(request.prompt_ids) + len(request.generated) >= self.max_length:
+            self._finish(request)
+
+    def _emit(self, request):
+        # Decode the whole answer and pass on only the new suffix, so
+        # tokenizers that merge spaces or bytes across tokens stream cleanly
+        text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        if text.endswith('\ufffd') or len(text) <= len(request.emitted):
+            return
+        piece, request.emitted = text[len(request.emitted):], text
+        try:
+            request.on_token(piece)
+        except Exception as e:
+            print(f"Error in token callback: {e}")
+
+    def _finish(self, request, error=None):
+        request.error = error
+        request.text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        if request.on_token is not None and len(request.text) > len(request.emitted):
+            # Whatever _emit held back waiting for more bytes
+            tail, request.emitted = request.text[len(request.emitted):], request.text
+            try:
+                request.on_token(tail)
+            except Exception as e:
+                print(f"Error in token callback: {e}")
+        if request.context is not None and error is None and request.cache is not None:
+            # The cache covers the first cache_len tokens of the transcript
+            ids = (request.prompt_ids + request.generated)[:request.cache_len]
+            try:
+                request.context.save(ids, request.cache)
+            except Exception as e:
+                print(f"Error saving conversation cache: {e}")
+        request.cache = None
+        request.draft_state = None
+        request.finished_at = time.perf_counter()
+        request.done.set()
+
+    def _run(self):
+        with torch.inference_mode():
+            while True:
+                self._admit()
+                for r in self._active:
+                    if r.cancelled and not r.done.is_set():
+                        self._finish(r)
+                self._active = [r for r in self._active if not r.done.is_set()]
+                if not self._active:
+                    continue
+                try:
+                    self._decode_step()
+                except Exception as e:
+                    print(f"Error in generation step: {e}")
+                    for r in self._active:
+                        self._finish(r, error=e)
+                self._active = [r for r in self._active if not r.done.is_set()]
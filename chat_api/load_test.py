@@ -0,0 +1,109 @@
+import argparse
+import threading
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+from generation import GenerationScheduler
+
+# Compares the old one-request-at-a-time generator(...) call with the
+# continuous batching scheduler at increasing concurrency, on CPU with a
+# small stand-in model:
+#
+#   python load_test.py --model sshleifer/tiny-gpt2 --concurrency 1,2,4,8,16
+
+PROMPTS = [
+    "How many sets should I do for hypertrophy?",
+    "What is the best protein intake for building muscle?",
+    "How do I improve my squat depth?",
+    "Is cardio bad for muscle gain?",
+    "How long should I rest between sets?",
+    "What should I eat before a morning workout?",
+    "How can I fix rounded shoulders?",
+    "How often should I train legs each week?",
+]
+
+SAMPLING = dict(max_length=200, temperature=0.7, top_p=0.9, repetition_penalty=1.1)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_clients(concurrency, requests_per_client, ask):
+    # ask(prompt) -> (new_tokens, first_token_seconds or None)
+    latencies, ttfts, tokens = [], [], []
+    lock = threading.Lock()
+
+    def client(offset):
+        for i in range(requests_per_client):
+            prompt = PROMPTS[(offset + i) % len(PROMPTS)]
+            start = time.perf_counter()
+            count, ttft = ask(prompt)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                tokens.append(count)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    return {
+        'tokens_per_s': sum(tokens) / wall,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'ttft_p95_ms': percentile(ttfts, 95) * 1000 if ttfts else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test chat generation")
+    parser.add_argument('--model', default="sshleifer/tiny-gpt2", help="Small local or hub model for CPU runs")
+    parser.add_argument('--concurrency', default="1,2,4,8,16")
+    parser.add_argument('--requests', type=int, default=4, help="Requests per client")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--skip-baseline', action='store_true')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    model.eval()
+
+    generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
+    scheduler = GenerationScheduler(model, tokenizer, max_batch=args.max_batch, **SAMPLING)
+
+    def ask_baseline(prompt):
+        # What flaskapp.py did before the scheduler: one full generate per request
+        out = generator(prompt, return_full_text=False, do_sample=True, **SAMPLING)
+        return len(tokenizer(out[0]['generated_text'])['input_ids']), None
+
+    def ask_scheduler(prompt):
+        request = scheduler.submit_async(prompt)
+        request.wait()
+        ttft = request.first_token_at - request.submitted_at if request.first_token_at else None
+        return len(request.generated), ttft
+
+    print(f"{'mode':<10} {'conc':>4} {'tok/s':>9} {'p50_ms':>9} {'p95_ms':>9} {'ttft_p95':>9}")
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        modes = [('batched', ask_scheduler)]
+        if not args.skip_baseline:
+            modes.insert(0, ('baseline', ask_baseline))
+        for name, ask in modes:
+            stats = run_clients(concurrency, args.requests, ask)
+            ttft = f"{stats['ttft_p95_ms']:>9.1f}" if stats['ttft_p95_ms'] is not None else f"{'-':>9}"
+            print(f"{name:<10} {concurrency:>4} {stats['tokens_per_s']:>9.1f} "
+                  f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {ttft}")
+
+
+if __name__ == '__main__':
+    main()
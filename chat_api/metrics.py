@@ -0,0 +1,52 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Chat stages range from sub-millisecond cache hits to multi-second decodes
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+stage_seconds = Histogram(
+    'chat_stage_seconds', "Time spent per chat request in each stage",
+    ['stage'], buckets=STAGE_BUCKETS)
+request_seconds = Histogram(
+    'chat_request_seconds', "Time to answer a chat request",
+    ['endpoint', 'source'], buckets=STAGE_BUCKETS)
+first_token_seconds = Histogram(
+    'chat_time_to_first_token_seconds', "Time from request to first generated token",
+    ['endpoint'], buckets=STAGE_BUCKETS)
+tokens_total = Counter(
+    'chat_tokens', "Tokens through the model",
+    ['kind'])
+
+
+def observe_generation(request):
+    # Splits one GenerationRequest into the worker's stages:
+    #   queue    - waiting for a free batch slot
+    #   tokenize - building and tokenizing the prompt
+    #   prefill  - prompt forward pass (only the uncached suffix)
+    #   decode   - every later decode step until the answer finished
+    if request.started_at is None or request.finished_at is None:
+        return
+    stage_seconds.labels('queue').observe(request.started_at - request.submitted_at)
+    if request.tokenized_at is None:
+        return
+    stage_seconds.labels('tokenize').observe(request.tokenized_at - request.started_at)
+    if request.prefilled_at is None:
+        return
+    stage_seconds.labels('prefill').observe(request.prefilled_at - request.tokenized_at)
+    stage_seconds.labels('decode').observe(request.finished_at - request.prefilled_at)
+    tokens_total.labels('prompt').inc(len(request.prompt_ids) - request.reused_tokens)
+    tokens_total.labels('reused').inc(request.reused_tokens)
+    tokens_total.labels('generated').inc(len(request.generated))
+    if request.drafted:
+        tokens_total.labels('drafted').inc(request.drafted)
+        tokens_total.labels('accepted').inc(request.accepted)
+
+
+def gauge(name, documentation, read):
+    # Sampled on every scrape
+    g = Gauge(name, documentation)
+    g.set_function(lambda: float(read() or 0))
+    return g
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+class _Entry:
+    def __init__(self, loader, warmup):
+        self.loader = loader
+        self.warmup = warmup
+        self.model = None
+        self.state = 'pending'
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready = threading.Event()
+
+
+class ModelRegistry:
+    # Loads registered models on a background thread after the server
+    # starts. get() raises ModelNotReady until a model has loaded (and
+    # warmed up), and status() backs the readiness endpoint.
+    def __init__(self, warmup=True):
+        self.warmup = warmup
+        self.started_at = time.time()
+        self._entries = OrderedDict()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None):
+        self._entries[name] = _Entry(loader, warmup)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.load_all, name="model-loader", daemon=True)
+                self._thread.start()
+
+    def load_all(self):
+        for name, entry in self._entries.items():
+            if entry.state != 'pending':
+                continue
+            entry.state = 'loading'
+            start = time.perf_counter()
+            try:
+                entry.model = entry.loader()
+                entry.load_seconds = time.perf_counter() - start
+                if self.warmup and entry.warmup is not None:
+                    start = time.perf_counter()
+                    entry.warmup(entry.model)
+                    entry.warmup_seconds = time.perf_counter() - start
+                entry.state = 'ready'
+            except Exception as e:
+                entry.state = 'failed'
+                entry.error = str(e)
+            entry.ready.set()
+
+    def get(self, name, timeout=0):
+        entry = self._entries[name]
+        if entry.state != 'ready':
+            self.start()
+            entry.ready.wait(timeout)
+        if entry.state != 'ready':
+            raise ModelNotReady(f"Model {name} is {entry.state}")
+        return entry.model
+
+    def state(self, name):
+        return self._entries[name].state
+
+    def is_ready(self):
+        return all(e.state == 'ready' for e in self._entries.values())
+
+    def status(self):
+        return {
+            'ready': self.is_ready(),
+            'uptime': time.time() - self.started_at,
+            'models': {
+                name: {
+                    'state': e.state,
+                    'load_seconds': e.load_seconds,
+                    'warmup_seconds': e.warmup_seconds,
+                    'error': e.error,
+                } for name, e in self._entries.items()
+            },
+        }
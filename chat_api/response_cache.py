@@ -0,0 +1,148 @@
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def normalize(message):
+    # Case, punctuation and spacing don't change the question
+    text = re.sub(r'[^\w\s]', ' ', message.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class ResponseCache:
+    # Three tiers, checked in order:
+    #   static   - regex rules answered without the model (greetings)
+    #   exact    - answers keyed on the normalized message, LRU + TTL
+    #   semantic - optional; a cached answer whose question embeds within
+    #              `similarity` (cosine) of the new one
+    # `embed(texts)` must return L2-normalized torch vectors, one per text.
+    # Expired entries are purged on every lookup, store and stats() call.
+    def __init__(self, max_entries=1024, ttl=3600, static_rules=None, embed=None, similarity=0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.static_rules = [([re.compile(p, re.IGNORECASE) for p in patterns], responder)
+                             for patterns, responder in (static_rules or [])]
+        self.embed = embed
+        self.similarity = similarity
+        self.hits = {'static': 0, 'exact': 0, 'semantic': 0}
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, expires_at, embedding)
+        self._expiry = deque()  # (expires_at, key), oldest first
+        self._recent_embeddings = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    def lookup(self, message, static_only=False):
+        # Returns (response, tier), or (None, None) on a miss. static_only
+        # is for follow-up turns, whose answer depends on the conversation
+        for patterns, responder in self.static_rules:
+            if any(p.search(message) for p in patterns):
+                with self._lock:
+                    self.hits['static'] += 1
+                return responder(), 'static'
+        if static_only:
+            return None, None
+
+        key = normalize(message)
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits['exact'] += 1
+                return entry[0], 'exact'
+
+        if self.embed is not None and key:
+            vector = self._embedding(key)
+            with self._lock:
+                match = self._nearest(vector, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.hits['semantic'] += 1
+                    return self._entries[match][0], 'semantic'
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def store(self, message, response):
+        key = normalize(message)
+        if not key:
+            return
+        vector = self._embedding(key) if self.embed is not None else None
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._entries[key] = (response, now + self.ttl, vector)
+            self._entries.move_to_end(key)
+            self._expiry.append((now + self.ttl, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            self._purge(time.time())
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0,
+            }
+
+    def _purge(self, now):
+        # Entries share one TTL, so they expire in the order they were stored;
+        # stale records (entries stored again or evicted) are skipped
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = self._expiry.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == expires:
+                del self._entries[key]
+                self._matrix = None
+        if len(self._expiry) > 2 * max(self.max_entries, 1):
+            self._expiry = deque(sorted((e[1], k) for k, e in self._entries.items()))
+
+    def _embedding(self, key):
+        # Lookup and the store that follows a miss embed the same text once
+        with self._lock:
+            vector = self._recent_embeddings.get(key)
+        if vector is None:
+            vector = self.embed([key])[0]
+            with self._lock:
+                self._recent_embeddings[key] = vector
+                while len(self._recent_embeddings) > 64:
+                    self._recent_embeddings.popitem(last=False)
+        return vector
+
+    def _nearest(self, vector, now):
+        # Only the semantic tier needs torch, so it isn't loaded at startup
+        import torch
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e[2] is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = torch.stack([self._entries[k][2] for k in self._matrix_keys])
+        scores = self._matrix @ vector.to(self._matrix.device)
+        for index in torch.argsort(scores, descending=True).tolist():
+            if float(scores[index]) < self.similarity:
+                return None
+            key = self._matrix_keys[index]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return key
+        return None
+
+
+def sentence_transformer_embedder(model_name):
+    # Optional semantic tier; needs the sentence-transformers package
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device='cpu')
+
+    def embed(texts):
+        return model.encode(texts, convert_to_tensor=True, normalize_embeddings=True)
+    return embed
@@ -0,0 +1,91 @@
+import numpy as np
+import torch
+from transformers import DynamicCache
+
+# Drafters for speculative decoding in GenerationScheduler. Each decode step
+# a drafter proposes a few tokens per request, the main model scores them
+# all in the same batched forward pass, and the scheduler keeps the longest
+# prefix that speculative sampling accepts, so the answer is distributed
+# exactly as without drafting.
+#
+# propose(request, limit) returns (tokens, probs): at most `limit` drafted
+# tokens and, per token, the distribution it was drawn from (None when the
+# draft is deterministic). rewind(request, length) tells the drafter that
+# only the first `length` tokens of prompt + answer are still valid.
+
+
+class PromptLookupDrafter:
+    # n-gram prompt lookup: the last few tokens are looked up earlier in the
+    # prompt and answer, and whatever followed the latest match is proposed.
+    # No model call at all; pays off when answers echo the question or
+    # repeat themselves, as fitness answers often do.
+    def __init__(self, num_tokens=10, max_ngram=3):
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+
+    def propose(self, request, limit):
+        ids = np.asarray(request.prompt_ids + request.generated)
+        limit = min(limit, self.num_tokens)
+        for n in range(min(self.max_ngram, len(ids) - 1), 0, -1):
+            windows = np.lib.stride_tricks.sliding_window_view(ids[:-1], n)
+            matches = np.flatnonzero((windows == ids[-n:]).all(axis=1))
+            if len(matches):
+                start = matches[-1] + n
+                return ids[start:start + limit].tolist(), None
+        return [], None
+
+    def rewind(self, request, length):
+        pass
+
+
+class DraftModelDrafter:
+    # A small model sharing the main model's tokenizer drafts num_tokens
+    # tokens one at a time, with its own KV cache per request kept in
+    # request.draft_state as (legacy cache, tokens cached).
+    def __init__(self, model, num_tokens=5, temperature=0.7):
+        self.model = model
+        self.num_tokens = num_tokens
+        self.temperature = temperature
+        self.device = next(model.parameters()).device
+        self._cache_objects = True
+
+    def propose(self, request, limit):
+        ids = request.prompt_ids + request.generated
+        cache, length = request.draft_state or (None, 0)
+        pending = ids[length:]
+        tokens, probs = [], []
+        for _ in range(min(limit, self.num_tokens)):
+            input_ids = torch.tensor([pending], device=self.device)
+            if cache is None:
+                out = self.model(input_ids=input_ids, use_cache=True)
+            else:
+                out = self.model(
+                    input_ids=input_ids,
+                    past_key_values=DynamicCache.from_legacy_cache(cache) if self._cache_objects else cache,
+                    use_cache=True,
+                )
+            self._cache_objects = hasattr(out.past_key_values, 'to_legacy_cache')
+            cache = out.past_key_values.to_legacy_cache() if self._cache_objects else out.past_key_values
+            length += len(pending)
+
+            logits = out.logits[0, -1].float()
+            if self.temperature:
+                q = torch.softmax(logits / self.temperature, dim=-1)
+                token = int(torch.multinomial(q, 1))
+            else:
+                token = int(torch.argmax(logits))
+                q = torch.zeros_like(logits)
+                q[token] = 1
+            tokens.append(token)
+            probs.append(q)
+            pending = [token]
+        request.draft_state = (cache, length)
+        return tokens, probs
+
+    def rewind(self, request, length):
+        if request.draft_state is None:
+            return
+        cache, cached = request.draft_state
+        if cached > length:
+            cache = tuple((k[:, :, :length], v[:, :, :length]) for k, v in cache)
+            request.draft_state = (cache, length)
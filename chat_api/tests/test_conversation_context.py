@@ -0,0 +1,40 @@
+import torch
+
+from conversation_context import ConversationStore
+
+
+def kv_cache(tokens, layers=2):
+    # 2 layers x (key, value) x 4 float32 values per token
+    return tuple((torch.zeros(1, 1, tokens, 1), torch.zeros(1, 1, tokens, 1)) for _ in range(layers))
+
+
+def cached(store):
+    return [cid for cid, context in store._contexts.items() if context.cache is not None]
+
+
+def test_byte_budget_evicts_least_recent_cache():
+    # Room for two 10-token caches of 160 bytes each
+    store = ConversationStore(max_cache_bytes=400)
+    for cid in ('a', 'b'):
+        store.get(cid).save(list(range(10)), kv_cache(10))
+    assert store.stats()['cache_bytes'] == 320
+
+    store.get('c').save(list(range(10)), kv_cache(10))
+    assert cached(store) == ['b', 'c']
+    assert store.stats()['cache_bytes'] == 320
+    # The conversation itself is remembered, only its cache is released
+    assert store.stats()['conversations'] == 3
+    assert store.get('a').reusable(list(range(11))) == (0, None)
+
+    # Using b makes c the oldest cache
+    assert store.get('b').reusable(list(range(11)))[0] == 10
+    store.get('d').save(list(range(10)), kv_cache(10))
+    assert cached(store) == ['b', 'd']
+
+
+def test_cache_over_budget_is_not_kept():
+    store = ConversationStore(max_cache_bytes=100)
+    context = store.get('a')
+    context.save(list(range(10)), kv_cache(10))
+    assert context.cache is None
+    assert store.stats()['cache_bytes'] == 0
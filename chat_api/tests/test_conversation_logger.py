@@ -0,0 +1,84 @@
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from conversation_logger import ConversationLogger  # noqa: E402
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+    def collection(self, name):
+        return FakeRef(f"{self.path}/{name}")
+
+    def document(self, name=None):
+        return FakeRef(f"{self.path}/{name or 'auto'}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        self.db.commits += 1
+        if self.db.outages:
+            self.db.outages -= 1
+            raise RuntimeError("unavailable")
+        if any(data.get('content') == 'bad' for _, data in self.writes):
+            raise RuntimeError("invalid argument")
+        self.db.written.extend(self.writes)
+
+
+class FakeDb:
+    # Firestore stand-in: the first `outages` commits fail, and so does any
+    # batch holding a message whose content is 'bad'
+    def __init__(self, outages=0):
+        self.outages = outages
+        self.commits = 0
+        self.written = []
+
+    def collection(self, name):
+        return FakeRef(name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def log(logger, *messages):
+    for i, message in enumerate(messages):
+        assert logger.log_turn(f"user{i}", message, "answer", f"conversation{i}")
+    assert logger.flush(wait=True, timeout=10)
+
+
+def test_retries_a_failed_batch():
+    db = FakeDb(outages=1)
+    logger = ConversationLogger(db, backoff=0.01)
+    log(logger, "one", "two", "three")
+    assert (logger.committed, logger.failed) == (3, 0)
+    assert db.commits == 2
+    assert len(db.written) == 3 * 4
+    logger.close()
+
+
+def test_one_bad_turn_does_not_sink_the_batch():
+    db = FakeDb(outages=1)
+    logger = ConversationLogger(db, max_retries=2, backoff=0.01)
+    log(logger, "one", "bad", "three")
+    assert (logger.committed, logger.failed) == (2, 1)
+    contents = [data['content'] for _, data in db.written if 'content' in data]
+    assert contents == ["one", "answer", "three", "answer"]
+    logger.close()
+
+
+def test_small_max_batch_still_drains():
+    db = FakeDb()
+    logger = ConversationLogger(db, max_batch=1, backoff=0.01)
+    log(logger, "one", "two")
+    assert (logger.committed, logger.failed) == (2, 0)
+    assert logger.pending() == 0
+    logger.close()
@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel, LlamaConfig, LlamaForCausalLM
+
+from conversation_context import ConversationStore
+from generation import GenerationScheduler
+from speculative import DraftModelDrafter, PromptLookupDrafter
+
+# Greedy answers from the continuously batched scheduler must match
+# model.generate() token for token: requests of different lengths share
+# left-padded caches, so any slip in the attention mask, position ids or
+# cache trimming shows up as a different answer. Tiny random models keep
+# this on CPU in seconds.
+
+EOS = 1
+PROMPTS = [
+    "squat squat squat depth depth",
+    "rest between sets rest between sets",
+    "protein",
+    "abcabcabcabc",
+    "how many reps should I do for a stronger bench press?",
+]
+
+
+class CharTokenizer:
+    eos_token_id = EOS
+
+    def __call__(self, text):
+        return {'input_ids': [2] + [3 + ord(c) % 90 for c in text]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(32 + (i - 3) % 90) for i in ids if i > 2)
+
+
+class PrintableTokenizer:
+    # One id per printable character and newline, so decode() round-trips
+    # and a transcript re-tokenizes to the ids already in the cache
+    eos_token_id = EOS
+
+    def __call__(self, text):
+        return {'input_ids': [2] + [3 if c == '\n' else ord(c) - 28 for c in text]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join('\n' if i == 3 else chr(i + 28) for i in ids if i > 2)
+
+
+def llama():
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=100, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, eos_token_id=EOS, bos_token_id=2)
+    return LlamaForCausalLM(config).eval()
+
+
+def gpt2():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=100, n_embd=32, n_layer=2, n_head=4, eos_token_id=EOS, bos_token_id=2)
+    return GPT2LMHeadModel(config).eval()
+
+
+def reference(model, tokenizer, prompt, max_length, repetition_penalty):
+    ids = tokenizer(prompt)['input_ids']
+    with torch.inference_mode():
+        out = model.generate(torch.tensor([ids]), attention_mask=torch.ones(1, len(ids), dtype=torch.long),
+                             do_sample=False, max_length=max_length, repetition_penalty=repetition_penalty,
+                             eos_token_id=EOS, pad_token_id=EOS)
+    return [t for t in out[0, len(ids):].tolist() if t != EOS]
+
+
+@pytest.mark.parametrize('make_model', [llama, gpt2])
+@pytest.mark.parametrize('drafter', ['none', 'lookup', 'self'])
+def test_greedy_matches_generate(make_model, drafter):
+    model = make_model()
+    tokenizer = CharTokenizer()
+    drafters = {
+        'none': lambda: None,
+        'lookup': lambda: PromptLookupDrafter(num_tokens=5),
+        # The model drafting for itself accepts every token, so whole
+        # drafts are kept and the cache is trimmed past them
+        'self': lambda: DraftModelDrafter(model, num_tokens=4, temperature=0),
+    }
+    scheduler = GenerationScheduler(model, tokenizer, max_batch=4, max_length=60, temperature=0,
+                                    repetition_penalty=1.1, drafter=drafters[drafter]())
+
+    # Submitted together, so the batch mixes prompt lengths and requests
+    # join and leave while others decode
+    requests = [scheduler.submit_async(prompt) for prompt in PROMPTS]
+    for request in requests:
+        request.wait(60)
+
+    for prompt, request in zip(PROMPTS, requests):
+        assert request.generated == reference(model, tokenizer, prompt, 60, 1.1), prompt
+    if drafter != 'none':
+        assert scheduler.tokens_drafted > 0
+
+
+@pytest.mark.parametrize('make_model', [llama, gpt2])
+def test_cancel_frees_slot_and_keeps_other_answers(make_model):
+    model = make_model()
+    tokenizer = CharTokenizer()
+    scheduler = GenerationScheduler(model, tokenizer, max_batch=2, max_length=60, temperature=0,
+                                    repetition_penalty=1.1)
+    submitted = threading.Event()
+    holder = []
+
+    def on_token(piece):
+        # Runs on the worker, like the stream's queue.put; cancelling here
+        # is what the chat_stream finally does when the client goes away
+        submitted.wait(10)
+        if len(holder[0].generated) == 5:
+            holder[0].cancel()
+
+    victim = scheduler.submit_async("protein", on_token=on_token)
+    holder.append(victim)
+    submitted.set()
+    others = [prompt for prompt in PROMPTS if prompt != "protein"]
+    requests = [scheduler.submit_async(prompt) for prompt in others]
+
+    victim.wait(60)
+    # Retired before its next decode step, with its cache released
+    assert len(victim.generated) == 5
+    assert victim.cache is None
+    for request in requests:
+        request.wait(60)
+    for prompt, request in zip(others, requests):
+        assert request.generated == reference(model, tokenizer, prompt, 60, 1.1), prompt
+    # The batch empties once the last request is retired
+    deadline = time.monotonic() + 5
+    while scheduler.in_flight() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.in_flight() == 0
+    assert len(victim.generated) == 5
+
+
+@pytest.mark.parametrize('make_model', [llama, gpt2])
+def test_follow_up_reuses_cache_and_matches_cold_run(make_model):
+    model = make_model()
+    tokenizer = PrintableTokenizer()
+    scheduler = GenerationScheduler(model, tokenizer, max_batch=2, max_length=40, temperature=0,
+                                    repetition_penalty=1.1)
+    question, follow_up = "how deep should I squat?", "and for front squats?"
+
+    store = ConversationStore(max_prompt_tokens=200)
+    context = store.get('warm')
+    first = scheduler.submit_async(question, context=context)
+    answer = first.wait(60)
+    store.record_turn(context, question, answer)
+    warm = scheduler.submit_async(follow_up, context=context)
+    warm.wait(60)
+
+    # The same transcript without a saved cache
+    cold_store = ConversationStore(max_prompt_tokens=200)
+    cold_context = cold_store.get('cold')
+    cold_store.record_turn(cold_context, question, answer)
+    cold = scheduler.submit_async(follow_up, context=cold_context)
+    cold.wait(60)
+
+    # Everything the first turn ran is reused: its prompt and all but the
+    # last answer token, which was never fed back
+    assert warm.reused_tokens == len(first.prompt_ids) + len(first.generated) - 1
+    assert cold.reused_tokens == 0
+    assert warm.prompt_ids == cold.prompt_ids
+    assert warm.generated == cold.generated
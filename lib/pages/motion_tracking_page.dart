@@ -25,6 +25,10 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
   bool isConnecting = false;
   bool useVoiceCommands = false;
 
+  // Session id returned by /start_tracking; every later call sends it so
+  // signed-out users don't share one session
+  String? sessionId;
+
   // Camera variables
   List<CameraDescription>? cameras;
   CameraController? cameraController;
@@ -191,13 +195,13 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
       // Take a picture
       final XFile imageFile = await cameraController!.takePicture();
       final bytes = await imageFile.readAsBytes();
-      final base64Image = 'data:image/jpeg;base64,${base64Encode(bytes)}';
 
-      // Send to backend
+      // Send the raw JPEG to the backend
       final response = await http.post(
-        Uri.parse('$apiUrl/process_frame'),
-        headers: {'Content-Type': 'application/json'},
-        body: json.encode({'image': base64Image}),
+        Uri.parse('$apiUrl/process_frame')
+            .replace(queryParameters: _sessionParams()),
+        headers: {'Content-Type': 'application/octet-stream'},
+        body: bytes,
       );
 
       if (response.statusCode == 200) {
@@ -231,6 +235,14 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
     }
   }
 
+  // Identifies this tracking session to the backend
+  Map<String, String> _sessionParams() {
+    return {
+      if (sessionId != null) 'session_id': sessionId!,
+      if (user != null) 'uid': user!.uid,
+    };
+  }
+
   Future<void> startTracking() async {
     if (!isCameraInitialized) {
       setState(() {
@@ -266,6 +278,9 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
       );
 
       if (response.statusCode == 200) {
+        final data = json.decode(response.body);
+        sessionId = data['session_id'];
+
         setState(() {
           isTracking = true;
           isConnecting = false;
@@ -298,8 +313,9 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
       await http.post(
         Uri.parse('$apiUrl/stop_tracking'),
         headers: {'Content-Type': 'application/json'},
-        body: json.encode({'uid': user?.uid}),
+        body: json.encode(_sessionParams()),
       );
+      sessionId = null;
 
       setState(() {
         isTracking = false;
@@ -324,7 +340,7 @@ class _MotionTrackingPageState extends State<MotionTrackingPage>
         final response = await http.post(
           Uri.parse('$apiUrl/change_mode'),
           headers: {'Content-Type': 'application/json'},
-          body: json.encode({'mode': newMode, 'uid': user?.uid}),
+          body: json.encode({'mode': newMode, ..._sessionParams()}),
         );
 
         if (response.statusCode == 200) {
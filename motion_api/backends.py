@@ -0,0 +1,220 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from model_registry import load_pose_model, warm_pose_model
+
+# Pose inference backends. torch runs the .pt weights as before; onnx and
+# openvino run a copy exported by ultralytics, which returns the same
+# Results objects, with keypoints scaled back to the 720x480 frame.
+BACKENDS = ('torch', 'onnx', 'openvino')
+# Packages each backend needs on top of ultralytics
+_RUNTIMES = {
+    'onnx': ('onnx', 'onnxruntime'),
+    'openvino': ('openvino',),
+}
+# What the last choose_backend() picked, for /ready; survives the fork
+# after gunicorn's on_starting
+selection = {}
+
+
+def env_config():
+    # MOTION_POSE_BACKEND    auto (default), torch, onnx or openvino
+    # MOTION_POSE_IMGSZ      inference size, e.g. 480 or 320 (default 640)
+    # MOTION_POSE_INT8       1 quantizes the OpenVINO export to INT8
+    # MOTION_POSE_INT8_DATA  calibration dataset yaml for INT8
+    # MOTION_MODEL_CACHE     where exported models are kept
+    # With MOTION_INFERENCE_WORKERS=N each worker gets cores/N threads, and
+    # the backends are benchmarked on that many
+    workers = int(os.environ.get("MOTION_INFERENCE_WORKERS", 0))
+    return {
+        'backend': os.environ.get("MOTION_POSE_BACKEND", "auto"),
+        'imgsz': int(os.environ.get("MOTION_POSE_IMGSZ", 0)) or None,
+        'int8': os.environ.get("MOTION_POSE_INT8", "0") == "1",
+        'cache_dir': os.environ.get("MOTION_MODEL_CACHE", "./model_cache"),
+        'data': os.environ.get("MOTION_POSE_INT8_DATA"),
+        'threads': worker_threads(workers) if workers > 0 else None,
+    }
+
+
+def worker_threads(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def available(backend):
+    return all(importlib.util.find_spec(name) is not None for name in _RUNTIMES.get(backend, ()))
+
+
+def model_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _cache_name(path, imgsz=None, int8=False):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{model_hash(path)}-{imgsz or 'default'}{'-int8' if int8 else ''}"
+
+
+def artifact_path(path, backend, imgsz=None, int8=False, cache_dir="./model_cache"):
+    name = _cache_name(path, imgsz, int8)
+    if backend == 'onnx':
+        return os.path.join(cache_dir, name + '.onnx')
+    return os.path.join(cache_dir, name + '_openvino_model')
+
+
+def export_model(path, backend, imgsz=None, int8=False, cache_dir="./model_cache", data=None):
+    # Exports once per (weights, backend, size, precision); later starts
+    # load the cached artifact. INT8 is OpenVINO only (NNCF post-training
+    # quantization, calibrated on `data`, ultralytics' coco8-pose by default).
+    if backend == 'torch':
+        return path
+    if int8 and backend != 'openvino':
+        raise ValueError(f"INT8 export is not supported for {backend}")
+    target = artifact_path(path, backend, imgsz, int8, cache_dir)
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+    os.makedirs(cache_dir, exist_ok=True)
+    # Export writes next to the weights, so it runs on a private copy; the
+    # finished artifact is moved into place last and a failed export is
+    # never picked up as cached
+    work = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        weights = shutil.copy(path, work)
+        kwargs = {'format': backend, 'dynamic': True, 'verbose': False}
+        if imgsz:
+            kwargs['imgsz'] = imgsz
+        if int8:
+            kwargs['int8'] = True
+            if data:
+                kwargs['data'] = data
+        exported = YOLO(weights).export(**kwargs)
+        os.replace(exported, target)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return target
+
+
+def limit_threads(model, artifact, threads):
+    # ultralytics builds ONNX Runtime and OpenVINO sessions on every core,
+    # and neither runtime takes a thread count from it (or, in their default
+    # builds, from OMP_NUM_THREADS), so the session is rebuilt with
+    # `threads`. The session only exists after the first predict.
+    import torch
+    torch.set_num_threads(threads)
+    backend = getattr(getattr(model, 'predictor', None), 'model', None)
+    if getattr(backend, 'onnx', False):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        backend.session = onnxruntime.InferenceSession(artifact, options, providers=backend.session.get_providers())
+    elif getattr(backend, 'xml', False):
+        backend.ov_compiled_model = backend.core.compile_model(
+            backend.ov_model,
+            device_name="CPU",
+            config={"PERFORMANCE_HINT": backend.inference_mode, "INFERENCE_NUM_THREADS": threads},
+        )
+
+
+def benchmark(model, rounds=20, artifact=None, threads=None):
+    # Median single-frame latency in ms on a noise frame (noise, unlike a
+    # blank frame, gives NMS and keypoint decoding some work), on `threads`
+    # threads when given
+    frame = np.random.default_rng(0).integers(0, 255, (480, 720, 3), dtype=np.uint8)
+    warm_pose_model(model)
+    if threads:
+        limit_threads(model, artifact, threads)
+        warm_pose_model(model)
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        model.predict(frame, verbose=False)
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+def choice_path(path, imgsz=None, int8=False, cache_dir="./model_cache", threads=None):
+    suffix = f"-{threads}threads" if threads else ""
+    return os.path.join(cache_dir, _cache_name(path, imgsz, int8) + suffix + '-backend.json')
+
+
+def _load_choice(target, candidates):
+    # The saved pick, if it was made among the same installed runtimes and
+    # its artifact is still there
+    try:
+        with open(target) as f:
+            choice = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if choice.get('candidates') != candidates or not os.path.exists(choice.get('artifact', '')):
+        return None
+    return choice
+
+
+def _save_choice(target, choice):
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    with open(target + '.tmp', 'w') as f:
+        json.dump(choice, f, indent=2)
+    os.replace(target + '.tmp', target)
+
+
+def choose_backend(path, backend='auto', imgsz=None, int8=False, cache_dir="./model_cache",
+                   data=None, rounds=20, threads=None):
+    # Returns (backend, artifact) and keeps no model loaded. 'auto' exports
+    # every backend whose runtime is installed, benchmarks each and keeps the
+    # fastest; a backend that fails to export or load is skipped. The pick is
+    # saved next to the exported models and reused on later starts while the
+    # weights, settings and installed runtimes are the same (delete the
+    # -backend.json file to benchmark again). With `threads` every backend is
+    # timed on that many threads, as a pose worker runs it. INT8 applies to
+    # openvino only.
+    if backend != 'auto':
+        artifact = export_model(path, backend, imgsz, int8, cache_dir, data)
+        selection.update(backend=backend, artifact=artifact, imgsz=imgsz, int8=int8, benchmark_ms={})
+        return backend, artifact
+
+    candidates = [candidate for candidate in BACKENDS if available(candidate)]
+    target = choice_path(path, imgsz, int8, cache_dir, threads)
+    choice = _load_choice(target, candidates)
+    if choice is None:
+        best = None
+        timings = {}
+        for candidate in candidates:
+            try:
+                artifact = export_model(path, candidate, imgsz, int8 and candidate == 'openvino', cache_dir, data)
+                ms = benchmark(load_pose_model(artifact, imgsz), rounds, artifact, threads)
+            except Exception as e:
+                print(f"Pose backend {candidate} unavailable: {e}")
+                continue
+            print(f"Pose backend {candidate}: {ms:.1f} ms/frame")
+            timings[candidate] = round(ms, 2)
+            if best is None or ms < best[0]:
+                best = (ms, candidate, artifact)
+        if best is None:
+            raise RuntimeError("No pose backend could be loaded")
+        _, backend, artifact = best
+        choice = {'backend': backend, 'artifact': artifact, 'candidates': candidates, 'benchmark_ms': timings}
+        _save_choice(target, choice)
+
+    backend, artifact = choice['backend'], choice['artifact']
+    selection.update(backend=backend, artifact=artifact, imgsz=imgsz,
+                     int8=int8 and backend == 'openvino', benchmark_ms=choice['benchmark_ms'])
+    return backend, artifact
+
+
+def select_backend(path, backend='auto', imgsz=None, int8=False, cache_dir="./model_cache",
+                   data=None, rounds=20, threads=None):
+    # Returns (backend, artifact, model), see choose_backend()
+    backend, artifact = choose_backend(path, backend, imgsz, int8, cache_dir, data, rounds, threads)
+    return backend, artifact, load_pose_model(artifact, imgsz)
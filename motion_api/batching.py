@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+
+
+class _PendingFrame:
+    def __init__(self, frame):
+        self.frame = frame
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class PoseBatcher:
+    # Micro-batching stage in front of the pose model. Request threads submit
+    # one frame each and block; a single worker thread gathers frames from all
+    # sessions until max_batch frames are queued or max_wait_ms has passed
+    # since the first one arrived, runs one batched forward pass and hands
+    # each request its own result.
+    def __init__(self, model, max_batch=8, max_wait_ms=5, model_lock=None, predict_kwargs=None):
+        self.model = model
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.model_lock = model_lock or threading.Lock()
+        self.predict_kwargs = {'verbose': False}
+        self.predict_kwargs.update(predict_kwargs or {})
+        self.batches = 0
+        self.frames = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="pose-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, frame, timeout=30):
+        pending = _PendingFrame(frame)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Pose inference timed out")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Window closed; still take whatever is already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                with self.model_lock:
+                    results = self.model.predict([p.frame for p in batch], **self.predict_kwargs)
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                self.batches += 1
+                self.frames += len(batch)
+                for pending in batch:
+                    pending.done.set()
@@ -0,0 +1,79 @@
+import argparse
+
+import numpy as np
+
+from backends import available, export_model
+from benchmark_batching import load_frame, run
+from model_registry import load_pose_model
+
+# Compares the pose backends (backends.py) at different input sizes: single
+# frame latency, batched throughput with concurrent clients, and how far the
+# keypoints move from the PyTorch model's (pass --image with a person in it,
+# noise has nobody to compare):
+#
+#   python benchmark_backends.py --image athlete.jpg --imgsz 640,480,320 --int8
+
+
+def keypoint_error(reference, keypoints):
+    # Mean pixel distance over the first person's points both models found
+    if reference is None or keypoints is None or not len(reference) or not len(keypoints):
+        return None
+    a, b = reference[0], keypoints[0]
+    found = (a != 0).any(axis=-1) & (b != 0).any(axis=-1)
+    if not found.any():
+        return None
+    return float(np.linalg.norm(a[found] - b[found], axis=-1).mean())
+
+
+def first_keypoints(model, frame):
+    result = model.predict(frame, verbose=False)[0]
+    if result.keypoints is None:
+        return None
+    return result.keypoints.xy.cpu().numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ONNX/OpenVINO pose backends against PyTorch")
+    parser.add_argument('--model', default="./yolo11n-pose.pt")
+    parser.add_argument('--image', help="Frame to replay (random noise if omitted)")
+    parser.add_argument('--backends', default="torch,onnx,openvino", help="Comma separated backends")
+    parser.add_argument('--imgsz', default="640", help="Comma separated input sizes")
+    parser.add_argument('--int8', action='store_true', help="Also try INT8 OpenVINO")
+    parser.add_argument('--data', help="Calibration dataset yaml for INT8")
+    parser.add_argument('--cache', default="./model_cache", help="Exported model cache directory")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--frames', type=int, default=25, help="Frames per client")
+    parser.add_argument('--batch', type=int, default=8, help="Max batch per forward pass")
+    args = parser.parse_args()
+
+    frame = load_frame(args.image)
+    reference = first_keypoints(load_pose_model(args.model), frame)
+
+    configs = []
+    for backend in args.backends.split(','):
+        if not available(backend):
+            print(f"Skipping {backend}: runtime not installed")
+            continue
+        for imgsz in [int(s) for s in args.imgsz.split(',')]:
+            configs.append((backend, imgsz, False))
+            if args.int8 and backend == 'openvino':
+                configs.append((backend, imgsz, True))
+
+    print(f"{'backend':>13} {'imgsz':>5} {'single_ms':>9} {'fps':>8} {'p95_ms':>8} {'kp_err_px':>9} {'speedup':>7}")
+    baseline = None
+    for backend, imgsz, int8 in configs:
+        artifact = export_model(args.model, backend, imgsz, int8, args.cache, args.data)
+        model = load_pose_model(artifact, imgsz)
+        keypoints = first_keypoints(model, frame)
+        single = run(model, frame, 1, args.frames, 1, 0)
+        stats = run(model, frame, args.clients, args.frames, args.batch, 5)
+        if baseline is None:
+            baseline = stats['fps']
+        error = keypoint_error(reference, keypoints)
+        name = backend + ('-int8' if int8 else '')
+        print(f"{name:>13} {imgsz:>5} {single['p50']:>9.1f} {stats['fps']:>8.1f} {stats['p95']:>8.1f} "
+              f"{'-' if error is None else f'{error:.1f}':>9} {stats['fps'] / baseline:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+from ultralytics import YOLO
+
+from batching import PoseBatcher
+
+# Measures throughput and per-frame latency of the batched pose stage for a
+# number of concurrent "phones" at different batch windows.
+#
+#   python benchmark_batching.py --clients 8 --windows 0,2,5,10 --batch 1,4,8
+
+
+def load_frame(path):
+    if path:
+        frame = cv.imread(path)
+        if frame is None:
+            raise SystemExit(f"Could not read image {path}")
+    else:
+        frame = np.random.randint(0, 255, (480, 720, 3), dtype=np.uint8)
+    return cv.resize(frame, (720, 480))
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run(model, frame, clients, frames_per_client, max_batch, wait_ms):
+    batcher = PoseBatcher(model, max_batch=max_batch, max_wait_ms=wait_ms)
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(frames_per_client):
+            t0 = time.perf_counter()
+            batcher.submit(frame)
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'fps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'avg_batch': batcher.frames / max(batcher.batches, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched YOLO pose inference")
+    parser.add_argument('--model', default="./yolo11n-pose.pt")
+    parser.add_argument('--image', help="Frame to replay (random noise if omitted)")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--frames', type=int, default=25, help="Frames per client")
+    parser.add_argument('--batch', default="1,4,8", help="Comma separated max batch sizes")
+    parser.add_argument('--windows', default="0,2,5,10", help="Comma separated batch windows in ms")
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    frame = load_frame(args.image)
+    # Warm up so the first configuration doesn't pay for model setup
+    model.predict([frame], verbose=False)
+
+    print(f"{'batch':>5} {'wait_ms':>7} {'fps':>8} {'p50_ms':>8} {'p95_ms':>8} {'avg_batch':>9}")
+    for max_batch in [int(b) for b in args.batch.split(',')]:
+        for wait_ms in [float(w) for w in args.windows.split(',')]:
+            stats = run(model, frame, args.clients, args.frames, max_batch, wait_ms)
+            print(f"{max_batch:>5} {wait_ms:>7.1f} {stats['fps']:>8.1f} {stats['p50']:>8.1f} "
+                  f"{stats['p95']:>8.1f} {stats['avg_batch']:>9.2f}")
+            if max_batch == 1:
+                # The window has no effect without batching
+                break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import threading
+import time
+
+from batching import PoseBatcher
+from benchmark_batching import load_frame, percentile
+from model_registry import load_pose_model
+from worker_pool import InferenceWorkerPool
+
+# Pose throughput of the in-process model against the multi-process worker
+# pool, with one client thread per tracking session:
+#
+#   python benchmark_workers.py --clients 16 --workers 1,2,4,8
+
+
+def run(submit, frame, clients, frames_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(session_id):
+        local = []
+        for _ in range(frames_per_client):
+            t0 = time.perf_counter()
+            submit(session_id, frame)
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(f"session-{c}",)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'fps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pose inference worker pool")
+    parser.add_argument('--model', default="./yolo11n-pose.pt")
+    parser.add_argument('--image', help="Frame to replay (random noise if omitted)")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--frames', type=int, default=25, help="Frames per client")
+    parser.add_argument('--workers', default="1,2,4,8", help="Comma separated worker process counts")
+    parser.add_argument('--batch', type=int, default=8, help="Max batch per forward pass")
+    parser.add_argument('--threads', type=int, help="Torch threads per worker (default cores / workers)")
+    args = parser.parse_args()
+
+    frame = load_frame(args.image)
+
+    # Baseline: what a single server process does today
+    model = load_pose_model(args.model)
+    model.predict([frame], verbose=False)
+    batcher = PoseBatcher(model, max_batch=args.batch, max_wait_ms=5)
+    baseline = run(lambda session_id, f: batcher.submit(f), frame, args.clients, args.frames)
+
+    print(f"{'workers':>7} {'fps':>8} {'p50_ms':>8} {'p95_ms':>8} {'speedup':>7}")
+    print(f"{'in-proc':>7} {baseline['fps']:>8.1f} {baseline['p50']:>8.1f} {baseline['p95']:>8.1f} {1.0:>7.2f}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        pool = InferenceWorkerPool(workers, args.model, max_batch=args.batch, threads_per_worker=args.threads)
+        try:
+            if not pool.wait_ready():
+                raise SystemExit(f"Workers failed to start: {pool.failed}")
+            # Every worker warms up on its own; one pass per session primes the routing too
+            run(pool.submit, frame, args.clients, 1)
+            stats = run(pool.submit, frame, args.clients, args.frames)
+        finally:
+            pool.close()
+        print(f"{workers:>7} {stats['fps']:>8.1f} {stats['p50']:>8.1f} {stats['p95']:>8.1f} "
+              f"{stats['fps'] / baseline['fps']:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
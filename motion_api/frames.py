@@ -0,0 +1,69 @@
+import base64
+import threading
+
+import cv2 as cv
+import numpy as np
+
+# Size the pose pipeline works at; clients that already send frames this
+# size skip the server-side resize
+FRAME_WIDTH = 720
+FRAME_HEIGHT = 480
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+
+# One upload buffer per request thread, grown as needed and reused
+_buffers = threading.local()
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def _upload_buffer(size):
+    buf = getattr(_buffers, 'buf', None)
+    if buf is None or len(buf) < size:
+        buf = bytearray(max(size, 256 * 1024))
+        _buffers.buf = buf
+    return buf
+
+
+def read_stream(stream, length):
+    # Read an encoded frame straight from the request stream into the
+    # thread's reusable buffer and return a view of the bytes read
+    if length > MAX_FRAME_BYTES:
+        raise FrameTooLarge(f"Frame exceeds {MAX_FRAME_BYTES} bytes")
+    view = memoryview(_upload_buffer(length))
+    readinto = getattr(stream, 'readinto', None)
+    n = 0
+    while n < length:
+        if readinto is not None:
+            read = readinto(view[n:length])
+        else:
+            chunk = stream.read(length - n)
+            read = len(chunk)
+            view[n:n + read] = chunk
+        if not read:
+            break
+        n += read
+    return view[:n]
+
+
+def decode_bytes(data):
+    if len(data) == 0:
+        return None
+    return cv.imdecode(np.frombuffer(data, np.uint8), cv.IMREAD_COLOR)
+
+
+def decode_base64(base64_image):
+    # Accepts both raw base64 and data: URLs
+    image_data = base64.b64decode(base64_image.split(',')[1] if ',' in base64_image else base64_image)
+    return decode_bytes(image_data)
+
+
+def decode_stream(stream, length):
+    return decode_bytes(read_stream(stream, length))
+
+
+def fit_frame(frame):
+    if frame.shape[1] == FRAME_WIDTH and frame.shape[0] == FRAME_HEIGHT:
+        return frame
+    return cv.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
@@ -0,0 +1,34 @@
+# Linux deployment: gunicorn -c gunicorn.conf.py motion_tracking:app
+#
+# The master exports the pose model and picks its backend once before the
+# workers fork. Torch weights are loaded there too, so the workers share one
+# copy instead of each loading their own; ONNX Runtime and OpenVINO sessions
+# aren't fork-safe and are built inside each worker. Everything else
+# (sessions, batcher, Firestore writer, speech) starts inside each worker.
+import multiprocessing
+import os
+
+bind = os.environ.get("MOTION_BIND", "0.0.0.0:5050")
+# Tracking sessions live in worker memory: run more than one worker only
+# behind a proxy that routes each uid/session_id to the same worker
+workers = int(os.environ.get("MOTION_WORKERS", 1))
+# Threads per worker serve the WebSocket streams and the batcher's callers
+worker_class = "gthread"
+threads = int(os.environ.get("MOTION_THREADS", 16))
+timeout = 120
+
+
+def on_starting(server):
+    from backends import choose_backend, env_config
+    from model_registry import load_pose_model, preload
+    path = os.environ.get("MOTION_POSE_MODEL", "./yolo11n-pose.pt")
+    config = env_config()
+    # Exporting and benchmarking the backends (backends.py) runs in a
+    # throwaway process, so no runtime thread pool exists in the master when
+    # it forks. It saves its pick; reading it back here only sets /ready's
+    # backend info.
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        pool.apply(choose_backend, (path,), config)
+    backend, artifact = choose_backend(path, **config)
+    if backend == 'torch' and int(os.environ.get("MOTION_INFERENCE_WORKERS", 0)) == 0:
+        preload('pose', lambda: load_pose_model(artifact, config['imgsz']))
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def format_workout(doc):
+    workout = doc.to_dict()
+    workout['id'] = doc.id
+    # Convert timestamps to strings for JSON
+    for field in ('start_time', 'end_time'):
+        if workout.get(field):
+            workout[field] = workout[field].strftime(TIME_FORMAT)
+    return workout
+
+
+def week_key(when):
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class WorkoutHistory:
+    # Workout history for the app's dashboard.
+    #
+    # page() lists a user's workouts newest first, `limit` at a time; the
+    # returned next_cursor (the last workout's id) fetches the following
+    # page. Pages and summaries are cached per uid for `ttl` seconds, for
+    # at most max_users users; invalidate(uid) drops a user's entries when
+    # one of their workouts changes.
+    #
+    # record_workout() folds a finished workout's stats into two rollup
+    # documents with server-side increments, usersData/{uid}/rollups/lifetime
+    # and .../rollups/{ISO week}, so summary() reads a fixed number of
+    # documents however many workouts there are.
+    def __init__(self, db, writer, page_size=10, max_page_size=50, max_users=1000, ttl=300):
+        self.db = db
+        self.writer = writer
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.max_users = max_users
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        # Bumped by every invalidate(); a load that overlapped one isn't cached
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def user_ref(self, uid):
+        return self.db.collection('usersData').document(uid)
+
+    def page(self, uid, cursor=None, limit=None):
+        limit = max(1, min(int(limit or self.page_size), self.max_page_size))
+        return self._cached(uid, ('page', cursor, limit), lambda: self._load_page(uid, cursor, limit))
+
+    def summary(self, uid, weeks=8):
+        weeks = max(1, min(int(weeks), 52))
+        return self._cached(uid, ('summary', weeks), lambda: self._load_summary(uid, weeks))
+
+    def record_workout(self, uid, started_at, stats):
+        # `stats` maps counter names (and duration) to this workout's totals
+        update = {
+            'workouts': firestore.Increment(1),
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }
+        increments = {name: firestore.Increment(value) for name, value in stats.items() if value}
+        if increments:
+            # An empty map would replace the running totals, even when merging
+            update['stats'] = increments
+        week = week_key(datetime.fromtimestamp(started_at, timezone.utc))
+        rollups = self.user_ref(uid).collection('rollups')
+        self.writer.set(rollups.document('lifetime'), update, merge=True)
+        self.writer.set(rollups.document(week), dict(update, week=week), merge=True)
+
+    def invalidate(self, uid):
+        with self._lock:
+            self._cache.pop(uid, None)
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+    def _cached(self, uid, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(uid)
+            if entry is not None and entry['expires'] <= now:
+                del self._cache[uid]
+                entry = None
+            if entry is not None and key in entry['values']:
+                self._cache.move_to_end(uid)
+                self.hits += 1
+                return entry['values'][key]
+            self.misses += 1
+            invalidations = self._invalidations
+
+        value = load()
+
+        with self._lock:
+            if self._invalidations != invalidations:
+                return value
+            entry = self._cache.get(uid)
+            if entry is None:
+                entry = {'expires': now + self.ttl, 'values': {}}
+                self._cache[uid] = entry
+            entry['values'][key] = value
+            self._cache.move_to_end(uid)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+        return value
+
+    def _load_page(self, uid, cursor, limit):
+        workouts = self.user_ref(uid).collection('workouts')
+        query = workouts.order_by('start_time', direction=firestore.Query.DESCENDING)
+        if cursor:
+            last = workouts.document(cursor).get()
+            if not last.exists:
+                raise InvalidCursor("Invalid cursor")
+            query = query.start_after(last)
+        # One extra document tells whether there is a next page
+        docs = list(query.limit(limit + 1).stream())
+        page = [format_workout(doc) for doc in docs[:limit]]
+        return {
+            'workouts': page,
+            'next_cursor': page[-1]['id'] if len(docs) > limit else None,
+        }
+
+    def _load_summary(self, uid, weeks):
+        rollups = self.user_ref(uid).collection('rollups')
+        today = datetime.now(timezone.utc)
+        keys = [week_key(today - timedelta(weeks=i)) for i in range(weeks)]
+        refs = [rollups.document('lifetime')] + [rollups.document(key) for key in keys]
+        docs = {doc.id: doc.to_dict() for doc in self.db.get_all(refs) if doc.exists}
+
+        def totals(data):
+            data = data or {}
+            return {'workouts': data.get('workouts', 0), 'stats': data.get('stats', {})}
+
+        return {
+            'lifetime': totals(docs.get('lifetime')),
+            'weeks': [dict(totals(docs.get(key)), week=key) for key in keys],
+        }
@@ -0,0 +1,178 @@
+import json
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+# On-device spotting of the voice mode commands. Audio streams through a
+# Vosk recognizer restricted to a handful of words, so nothing leaves the
+# machine and a command is acted on a few hundred milliseconds after it is
+# said. Audio comes from the microphone or, for tests, from WAV files:
+#
+#   python keywords.py --model ./vosk-model-small-en-us-0.15 commands.wav
+
+# Spoken word -> voice command
+COMMANDS = {
+    'normal': 'normal',
+    'combine': 'combine',
+    'combined': 'combine',
+    'tricep': 'triceps',
+    'triceps': 'triceps',
+    'stop': 'stop',
+}
+SAMPLE_RATE = 16000
+CHUNK_MS = 100
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(path):
+    # One Vosk model per path, shared by every session's recognizer
+    with _models_lock:
+        if path not in _models:
+            from vosk import Model, SetLogLevel
+            SetLogLevel(-1)
+            _models[path] = Model(path)
+        return _models[path]
+
+
+class KeywordSpotter:
+    # Feed it 16-bit mono PCM with accept(); it returns a command when one
+    # is heard, else None. The grammar only knows the command words and
+    # [unk], so anything else decodes as [unk] instead of a near miss.
+    #
+    # A command fires as soon as `stable_partials` consecutive partial
+    # hypotheses agree on it (partials carry no confidence), or at the end
+    # of the utterance when the word's confidence is at least
+    # min_confidence; each utterance fires at most once.
+    def __init__(self, model, sample_rate=SAMPLE_RATE, min_confidence=0.6, stable_partials=2):
+        from vosk import KaldiRecognizer
+        self.recognizer = KaldiRecognizer(model, sample_rate, json.dumps(sorted(COMMANDS) + ['[unk]']))
+        self.recognizer.SetWords(True)
+        self.min_confidence = min_confidence
+        self.stable_partials = stable_partials
+        self._candidate = None
+        self._seen = 0
+        self._fired = False
+
+    def accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            result = json.loads(self.recognizer.Result())
+            fired = self._fired
+            self._candidate, self._seen, self._fired = None, 0, False
+            if fired:
+                return None
+            for word in result.get('result', []):
+                if word['word'] in COMMANDS and word.get('conf', 0) >= self.min_confidence:
+                    return COMMANDS[word['word']]
+            return None
+
+        if self._fired or not self.stable_partials:
+            return None
+        words = json.loads(self.recognizer.PartialResult()).get('partial', '').split()
+        command = next((COMMANDS[w] for w in words if w in COMMANDS), None)
+        if command is not None and command == self._candidate:
+            self._seen += 1
+        else:
+            self._candidate, self._seen = command, 1
+        if command is None or self._seen < self.stable_partials:
+            return None
+        self._fired = True
+        return command
+
+    def finish(self):
+        # Decodes whatever audio is left, e.g. at the end of a WAV file
+        if self._fired:
+            return None
+        result = json.loads(self.recognizer.FinalResult())
+        for word in result.get('result', []):
+            if word['word'] in COMMANDS and word.get('conf', 0) >= self.min_confidence:
+                return COMMANDS[word['word']]
+        return None
+
+
+def microphone_chunks(sample_rate=SAMPLE_RATE, chunk_ms=CHUNK_MS):
+    # One input stream for the whole run instead of a Microphone context
+    # per utterance
+    import pyaudio
+    frames = sample_rate * chunk_ms // 1000
+    audio = pyaudio.PyAudio()
+    stream = audio.open(format=pyaudio.paInt16, channels=1, rate=sample_rate,
+                        input=True, frames_per_buffer=frames)
+    try:
+        while True:
+            yield stream.read(frames, exception_on_overflow=False)
+    finally:
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
+
+
+def wav_rate(path):
+    with wave.open(path, 'rb') as f:
+        return f.getframerate()
+
+
+def wav_chunks(path, chunk_ms=CHUNK_MS, realtime=False):
+    # 16-bit WAV in microphone-sized chunks (stereo is mixed down); with
+    # realtime=True it is paced like a live microphone
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit PCM")
+        channels = f.getnchannels()
+        frames = f.getframerate() * chunk_ms // 1000
+        while True:
+            data = f.readframes(frames)
+            if not data:
+                break
+            if channels > 1:
+                samples = np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+                data = samples.mean(axis=1).astype(np.int16).tobytes()
+            yield data
+            if realtime:
+                time.sleep(chunk_ms / 1000)
+
+
+def spot_file(model, path, min_confidence=0.6, stable_partials=2, chunk_ms=CHUNK_MS):
+    # [(seconds into the file when the command fired, command)]
+    spotter = KeywordSpotter(model, wav_rate(path), min_confidence, stable_partials)
+    heard = []
+    position = 0.0
+    for chunk in wav_chunks(path, chunk_ms):
+        position += chunk_ms / 1000
+        command = spotter.accept(chunk)
+        if command:
+            heard.append((round(position, 2), command))
+    command = spotter.finish()
+    if command:
+        heard.append((round(position, 2), command))
+    return heard
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Spot voice commands in WAV files")
+    parser.add_argument('inputs', nargs='+', help="16-bit WAV files")
+    parser.add_argument('--model', default="./vosk-model-small-en-us-0.15")
+    parser.add_argument('--min-confidence', type=float, default=0.6)
+    parser.add_argument('--stable-partials', type=int, default=2,
+                        help="Agreeing partial results before firing early (0 waits for the utterance end)")
+    parser.add_argument('--expect', help="Comma separated commands expected in every input, in order")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    failed = False
+    for path in args.inputs:
+        heard = spot_file(model, path, args.min_confidence, args.stable_partials)
+        print(f"{path}: " + (", ".join(f"{command}@{t:.2f}s" for t, command in heard) or "nothing"))
+        if args.expect is not None and [c for _, c in heard] != args.expect.split(','):
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
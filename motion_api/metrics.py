@@ -0,0 +1,40 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Per-frame stages run from ~1 ms (angle math) to ~1 s (a cold model on CPU)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+stage_seconds = Histogram(
+    'motion_stage_seconds', "Time spent per frame in each processing stage",
+    ['stage'], buckets=STAGE_BUCKETS)
+frame_seconds = Histogram(
+    'motion_frame_seconds', "Time to handle one frame, decode to reply",
+    ['transport'], buckets=STAGE_BUCKETS)
+frames_total = Counter(
+    'motion_frames', "Frames received, by outcome",
+    ['transport', 'result'])
+reps_total = Counter(
+    'motion_reps', "Reps counted",
+    ['counter'])
+
+
+def observe_frame(transport, timings, started, result=None):
+    # `timings` is the per-stage dict filled in by FramePipeline.process
+    for stage, seconds in timings.items():
+        stage_seconds.labels(stage).observe(seconds)
+    frame_seconds.labels(transport).observe(time.perf_counter() - started)
+    if result is None:
+        result = 'inferred' if 'inference' in timings else 'skipped'
+    frames_total.labels(transport, result).inc()
+
+
+def gauge(name, documentation, read):
+    # Sampled on every scrape
+    g = Gauge(name, documentation)
+    g.set_function(lambda: float(read() or 0))
+    return g
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
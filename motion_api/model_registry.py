@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Models loaded before the workers were forked (see gunicorn.conf.py).
+# Forked workers find them here and share the weight pages copy-on-write.
+_preloaded = {}
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+def preload(name, loader):
+    if name not in _preloaded:
+        _preloaded[name] = loader()
+    return _preloaded[name]
+
+
+def load_pose_model(path="./yolo11n-pose.pt", imgsz=None):
+    # Imported here: ultralytics pulls in torch, which alone takes seconds.
+    # Loads .pt weights or an exported ONNX/OpenVINO artifact (see
+    # backends.py); imgsz overrides the inference size of every predict.
+    from ultralytics import YOLO
+    model = YOLO(path) if path.endswith('.pt') else YOLO(path, task='pose')
+    if imgsz:
+        model.overrides['imgsz'] = imgsz
+    return model
+
+
+def infer_pose(model, frame, tracking='predict'):
+    # One frame through the shared model, as /process_frame and replay.py
+    # run it: only 'track' sessions use the model's stateful tracker
+    if tracking == 'track':
+        return model.track(frame, verbose=False)[0]
+    return model.predict(frame, verbose=False)[0]
+
+
+def warm_pose_model(model):
+    # First call builds the fused graph and picks kernels
+    model.predict(np.zeros((480, 720, 3), dtype=np.uint8), verbose=False)
+
+
+class _Entry:
+    def __init__(self, loader, warmup):
+        self.loader = loader
+        self.warmup = warmup
+        self.model = None
+        self.state = 'pending'
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready = threading.Event()
+
+
+class ModelRegistry:
+    # Loads registered models on a background thread, so the server binds
+    # and answers liveness checks immediately; get() waits for (or refuses
+    # with ModelNotReady) a model that isn't loaded yet.
+    def __init__(self, warmup=True):
+        self.warmup = warmup
+        self.started_at = time.time()
+        self._entries = OrderedDict()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None):
+        self._entries[name] = _Entry(loader, warmup)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.load_all, name="model-loader", daemon=True)
+                self._thread.start()
+
+    def load_all(self):
+        for name, entry in self._entries.items():
+            if entry.state != 'pending':
+                continue
+            entry.state = 'loading'
+            start = time.perf_counter()
+            try:
+                entry.model = _preloaded[name] if name in _preloaded else entry.loader()
+                entry.load_seconds = time.perf_counter() - start
+                if self.warmup and entry.warmup is not None:
+                    start = time.perf_counter()
+                    entry.warmup(entry.model)
+                    entry.warmup_seconds = time.perf_counter() - start
+                entry.state = 'ready'
+                print(f"Loaded {name} in {entry.load_seconds:.1f}s")
+            except Exception as e:
+                entry.state = 'failed'
+                entry.error = str(e)
+                print(f"Error loading {name}: {e}")
+            entry.ready.set()
+
+    def get(self, name, timeout=0):
+        entry = self._entries[name]
+        if entry.state != 'ready':
+            self.start()
+            entry.ready.wait(timeout)
+        if entry.state != 'ready':
+            raise ModelNotReady(f"Model {name} is {entry.state}")
+        return entry.model
+
+    def is_ready(self):
+        return all(e.state == 'ready' for e in self._entries.values())
+
+    def status(self):
+        return {
+            'ready': self.is_ready(),
+            'uptime': time.time() - self.started_at,
+            'models': {
+                name: {
+                    'state': e.state,
+                    'preloaded': name in _preloaded,
+                    'load_seconds': e.load_seconds,
+                    'warmup_seconds': e.warmup_seconds,
+                    'error': e.error,
+                } for name, e in self._entries.items()
+            },
+        }
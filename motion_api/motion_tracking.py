@@ -1,196 +1,272 @@
 from flask import Flask, Response, jsonify, request
-import cv2 as cv
-import numpy as np
-from ultralytics import YOLO
 import threading
 import time
 import json
 import speech_recognition as sr
-import pyttsx3
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 import os
+import atexit
+import importlib.util
+from datetime import datetime, timezone
 import firebase_admin
 from firebase_admin import credentials, firestore
-import base64
+from sessions import MODES, TRACKING, SessionStore
+from batching import PoseBatcher
+from frames import FrameTooLarge, decode_base64, decode_bytes, decode_stream
+from streaming import LatestFrameSlot
+from rep_engine import RepEngine
+from speech import SpeechWorker, make_sink
+from keywords import COMMANDS, SAMPLE_RATE, KeywordSpotter, load_model as load_keyword_model, microphone_chunks, wav_chunks, wav_rate
+from scheduler import AdaptiveScheduler
+from pipeline import FramePipeline, render_preview, thresholds
+from workout_writer import WorkoutWriter
+from history import InvalidCursor, WorkoutHistory
+from model_registry import ModelNotReady, ModelRegistry, infer_pose, warm_pose_model
+from backends import choose_backend, env_config, select_backend, selection as backend_selection
+from worker_pool import InferenceWorkerPool
+from metrics import frames_total, gauge, observe_frame, render as render_metrics, reps_total, stage_seconds
+from profiler import SamplingProfiler
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
+sock = Sock(app)
+
+# Pose worker processes (MOTION_INFERENCE_WORKERS) are spawned, so under
+# `python motion_tracking.py` each one imports this file as __mp_main__.
+# They only run worker_pool, so Firebase, the background writer and speech
+# threads and their exit hooks are set up in the app process alone.
+app_process = __name__ != '__mp_main__'
 
 # Configure Firebase Emulator
 os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080" 
 
-# Initialize Firebase with emulator
-cred = credentials.Certificate(r"./firebase-cardential/")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+if app_process:
+    # Initialize Firebase with emulator
+    cred = credentials.Certificate(r"./firebase-cardential/")
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
+    # Workout documents and rep events are written behind the request path in
+    # batches; pending writes are flushed on shutdown
+    workout_writer = WorkoutWriter(
+        db,
+        max_batch=int(os.environ.get("MOTION_WRITE_BATCH", 200)),
+        flush_interval=float(os.environ.get("MOTION_WRITE_INTERVAL", 2.0)),
+    )
+    atexit.register(workout_writer.close)
+
+    # Workout history pages and per-user rollups (lifetime and per ISO week),
+    # cached per uid for MOTION_HISTORY_TTL seconds; starting or stopping a
+    # workout drops the user's cached entries
+    history = WorkoutHistory(
+        db,
+        workout_writer,
+        page_size=int(os.environ.get("MOTION_HISTORY_PAGE", 10)),
+        max_users=int(os.environ.get("MOTION_HISTORY_USERS", 1000)),
+        ttl=float(os.environ.get("MOTION_HISTORY_TTL", 300)),
+    )
 
 # Global variables
-model = YOLO("./yolo11n-pose.pt")  # Use a valid path or download the model
-counters = {
-    "left_hand": 0,
-    "right_hand": 0,
-    "combine": 0,
-    "left_tricep": 0,
-    "right_tricep": 0,
-}
-mode = "normal"
-is_running = False
-current_frame = None
-angles = {"left": 0, "right": 0}
-voice_recognition_active = False
-active_users = {}  # Track active users by UID
-
-# Configure thresholds
-thresholds = {
-    "bicep_up": 170,
-    "bicep_down": 45,
-    "tricep_up": 170,
-    "tricep_down": 90
-}
+# The pose model loads in the background once the server is up, then runs
+# one dummy frame (MOTION_WARMUP=0 skips it); /ready turns 200 when done.
+# Frames that arrive earlier wait up to MOTION_MODEL_WAIT seconds, then get
+# a 503.
+models = ModelRegistry(warmup=os.environ.get("MOTION_WARMUP", "1") == "1")
+pose_model_path = os.environ.get("MOTION_POSE_MODEL", "./yolo11n-pose.pt")
+# The weights can run as exported ONNX/OpenVINO models, cached on disk by
+# model hash; by default the fastest installed backend is picked with a short
+# benchmark on the first start and remembered (see backends.env_config for
+# the settings)
+pose_config = env_config()
 
-# States
-states = {
-    "push_up_left": False,
-    "push_up_right": False,
-    "combine": False,
-    "tricep_push_left": False,
-    "tricep_push_right": False,
-}
+# MOTION_INFERENCE_WORKERS=N runs pose inference in N worker processes,
+# each with its own model; frames go over shared memory and every session
+# sticks to one worker. 0 keeps inference in this process.
+inference_workers = int(os.environ.get("MOTION_INFERENCE_WORKERS", 0))
+pose_pool = None
 
-# Initialize text-to-speech engine
-engine = pyttsx3.init()
-voices = engine.getProperty('voices')
-engine.setProperty('voice', voices[0].id)
-engine.setProperty('rate', 150)
+def start_pose_pool():
+    global pose_pool
+    # Export and pick the backend once here; the workers load the artifact
+    _, artifact = choose_backend(pose_model_path, **pose_config)
+    pool = InferenceWorkerPool(inference_workers, artifact, max_batch=max(1, batch_max),
+                               imgsz=pose_config['imgsz'])
+    atexit.register(pool.close)
+    if not pool.wait_ready():
+        pool.close()
+        raise RuntimeError(f"Pose workers failed to start: {pool.failed}")
+    pose_pool = pool
+    return pool
 
-def speak(text):
-    if voice_recognition_active:
-        engine.say(text)
-        engine.runAndWait()
+if inference_workers > 0:
+    models.register('pose_workers', start_pose_pool)
+else:
+    models.register('pose', lambda: select_backend(pose_model_path, **pose_config)[2], warmup=warm_pose_model)
+model_wait = float(os.environ.get("MOTION_MODEL_WAIT", 0))
+# The tracker state lives inside the model, so only one frame runs at a time
+model_lock = threading.Lock()
 
-def calculate_angle(a, b, c):
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians*180.0/np.pi)
-    
-    if angle > 180.0:
-        angle = 360-angle
-    return angle
+# Frames from concurrent sessions are grouped into one batched forward pass.
+# MOTION_BATCH_MAX=1 runs each frame on its own.
+batch_max = int(os.environ.get("MOTION_BATCH_MAX", 8))
+batch_wait_ms = float(os.environ.get("MOTION_BATCH_WAIT_MS", 5))
+batcher = None
+batcher_lock = threading.Lock()
 
-def process_frame(frame):
-    global angles, counters, mode, states
-    
-    frame = cv.resize(frame, (720, 480))
-    result = model.track(frame)
-    
-    if result[0].keypoints is not None:
-        keypoints = result[0].keypoints.xy.cpu().numpy()
-        
-        for keypoint in keypoints:
-            if len(keypoint) > 0:
-                if len(keypoint) > 10:  # We need at least 11 points
-                    # Extract joint positions
-                    left_shoulder = (int(keypoint[5][0]), int(keypoint[5][1]))
-                    left_elbow = (int(keypoint[7][0]), int(keypoint[7][1]))
-                    left_wrist = (int(keypoint[9][0]), int(keypoint[9][1]))
-                    
-                    right_shoulder = (int(keypoint[6][0]), int(keypoint[6][1]))
-                    right_elbow = (int(keypoint[8][0]), int(keypoint[8][1]))
-                    right_wrist = (int(keypoint[10][0]), int(keypoint[10][1]))
-                    
-                    # Calculate angles
-                    left_hand_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-                    right_hand_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-                    
-                    angles["left"] = int(left_hand_angle)
-                    angles["right"] = int(right_hand_angle)
-                    
-                    # Process based on mode
-                    if mode == "normal":
-                        # Bicep curls - Left
-                        if left_hand_angle < thresholds["bicep_down"] and not states["push_up_left"]:
-                            states["push_up_left"] = True
-                            counters["left_hand"] += 1
-                            speak(f"left {counters['left_hand']}")
-                        elif left_hand_angle > thresholds["bicep_up"] and states["push_up_left"]:
-                            states["push_up_left"] = False
-                        
-                        # Bicep curls - Right
-                        if right_hand_angle < thresholds["bicep_down"] and not states["push_up_right"]:
-                            states["push_up_right"] = True
-                            counters["right_hand"] += 1
-                            speak(f"right {counters['right_hand']}")
-                        elif right_hand_angle > thresholds["bicep_up"] and states["push_up_right"]:
-                            states["push_up_right"] = False
-                            
-                    elif mode == "combine":
-                        # Combined bicep curls
-                        if (right_hand_angle <= thresholds["bicep_down"] and 
-                            left_hand_angle <= thresholds["bicep_down"] and not states["combine"]):
-                            states["combine"] = True
-                            counters["combine"] += 1
-                            speak(f"combine {counters['combine']}")
-                        elif (left_hand_angle >= thresholds["bicep_up"] and 
-                              right_hand_angle >= thresholds["bicep_up"] and states["combine"]):
-                            states["combine"] = False
-                            
-                    elif mode == "triceps":
-                        # Tricep extensions - Left
-                        if left_hand_angle > thresholds["tricep_up"] and not states["tricep_push_left"]:
-                            states["tricep_push_left"] = True
-                            counters["left_tricep"] += 1
-                            speak(f"left tricep {counters['left_tricep']}")
-                        elif left_hand_angle < thresholds["tricep_down"] and states["tricep_push_left"]:
-                            states["tricep_push_left"] = False
-                        
-                        # Tricep extensions - Right
-                        if right_hand_angle > thresholds["tricep_up"] and not states["tricep_push_right"]:
-                            states["tricep_push_right"] = True
-                            counters["right_tricep"] += 1
-                            speak(f"right tricep {counters['right_tricep']}")
-                        elif right_hand_angle < thresholds["tricep_down"] and states["tricep_push_right"]:
-                            states["tricep_push_right"] = False
-            
-                # Draw keypoints on the frame
-                for i, point in enumerate(keypoint):
-                    cx, cy = int(point[0]), int(point[1])
-                    cv.circle(frame, (cx, cy), 5, (255, 0, 0), -1)
-                    cv.putText(frame, f'{i}', (cx, cy), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                
-    # Add text to frame
-    cv.putText(frame, f"Mode: {mode}", (10, 30), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-    
-    if mode == "normal":
-        cv.putText(frame, f"Left: {counters['left_hand']} Right: {counters['right_hand']}", 
-                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-    elif mode == "combine":
-        cv.putText(frame, f"Combined: {counters['combine']}", 
-                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-    elif mode == "triceps":
-        cv.putText(frame, f"Left Tricep: {counters['left_tricep']} Right Tricep: {counters['right_tricep']}", 
-                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                   
-    # Store current frame for debugging
-    global current_frame
-    current_frame = frame
-    
-    return frame
+def release_session(session):
+    if pose_pool is not None:
+        pose_pool.release(session.session_id)
+
+# Per-athlete tracking sessions, keyed by session_id (defaults to the uid)
+sessions = SessionStore(
+    max_sessions=int(os.environ.get("MOTION_MAX_SESSIONS", 64)),
+    idle_timeout=float(os.environ.get("MOTION_SESSION_IDLE_TIMEOUT", 600)),
+    on_evict=release_session,
+)
+
+rep_engine = RepEngine(thresholds)
+
+# Sessions skip pose inference on frames far from a rep boundary when
+# adaptive scheduling is on (per session via 'adaptive' in /start_tracking)
+adaptive_default = os.environ.get("MOTION_ADAPTIVE_INFERENCE", "0") == "1"
+
+# How sessions follow the athlete (per session via 'tracking' in
+# /start_tracking): predict, smooth or track; see sessions.TRACKING
+tracking_default = os.environ.get("MOTION_TRACKING", "predict")
+
+# Text-to-speech runs on its own worker thread; MOTION_TTS_SINK picks the
+# output (pyttsx3, null or file:<path>)
+speech = SpeechWorker(make_sink()) if app_process else None
+
+def speak(session, text, key=None):
+    # Announcements with the same key coalesce, so only the latest rep
+    # count for a counter gets spoken
+    if session.voice_active:
+        speech.say(text, key=(session.session_id, key) if key else None)
+
+def pose_batcher(model):
+    global batcher
+    with batcher_lock:
+        if batcher is None:
+            batcher = PoseBatcher(model, batch_max, batch_wait_ms, model_lock)
+        return batcher
+
+def run_pose(frame, session=None):
+    if inference_workers > 0:
+        pool = models.get('pose_workers', timeout=model_wait)
+        return pool.submit(session.session_id if session else None, frame)
+    model = models.get('pose', timeout=model_wait)
+    if session is not None and session.tracking == 'track':
+        # The tracker is stateful inside the shared model, so these frames
+        # are never batched with other sessions
+        with model_lock:
+            return infer_pose(model, frame, 'track')
+    if batch_max > 1:
+        return pose_batcher(model).submit(frame)
+    with model_lock:
+        return infer_pose(model, frame)
+
+def record_rep(session, rep):
+    reps_total.labels(rep.counter).inc()
+    # One document per counted rep, written with the next batch
+    if session.workout_id:
+        workout_writer.set(workout_ref_for(session).collection('reps').document(), {
+            'counter': rep.counter,
+            'count': rep.count,
+            'angle': rep.angle,
+            'mode': session.mode,
+            'timestamp': datetime.now(timezone.utc),
+        })
+
+pipeline = FramePipeline(run_pose, rep_engine, speak, on_rep=record_rep)
+
+# Queue depths and in-flight work, sampled on each /metrics scrape
+gauge('motion_sessions', "Tracking sessions held in memory", lambda: len(sessions))
+gauge('motion_batch_queue_depth', "Frames waiting for the in-process pose batcher",
+      lambda: batcher.queue_depth() if batcher is not None else 0)
+gauge('motion_pool_in_flight', "Frames inside the inference worker pool",
+      lambda: pose_pool.stats()['in_flight'] if pose_pool is not None else 0)
+if app_process:
+    gauge('motion_write_queue_depth', "Firestore writes waiting to be committed", workout_writer.pending)
+    gauge('motion_speech_queue_depth', "Announcements waiting to be spoken", speech.pending)
+gauge('motion_model_ready', "1 once the pose model is loaded", models.is_ready)
+
+# Sampling profiler for a live server, off unless MOTION_PROFILER=1
+profiler = SamplingProfiler()
+profiler_enabled = os.environ.get("MOTION_PROFILER", "0") == "1"
+
+def process_frame(session, frame, timings=None):
+    return pipeline.process(session, frame, timings)
+
+# Voice commands are spotted on-device by default (keywords.py, a Vosk
+# model at MOTION_VOSK_MODEL); MOTION_VOICE_ENGINE=google goes back to
+# Google Speech Recognition, which needs internet access.
+# MOTION_VOICE_INPUT=<file.wav> replays a recording instead of the microphone.
+voice_engine = os.environ.get("MOTION_VOICE_ENGINE", "vosk")
+vosk_model_path = os.environ.get("MOTION_VOSK_MODEL", "./vosk-model-small-en-us-0.15")
+voice_input = os.environ.get("MOTION_VOICE_INPUT", "mic")
+voice_min_confidence = float(os.environ.get("MOTION_VOICE_MIN_CONFIDENCE", 0.6))
+if app_process and voice_engine == "vosk" and (importlib.util.find_spec("vosk") is None
+                                               or not os.path.isdir(vosk_model_path)):
+    # Checked once at startup, so voice commands don't silently stop working
+    print(f"Vosk or its model at {vosk_model_path} is missing; voice commands fall back to "
+          f"Google Speech Recognition (set MOTION_VOSK_MODEL, or MOTION_VOICE_ENGINE=google)")
+    voice_engine = "google"
+voice_announcements = {
+    "normal": "Normal mode activated",
+    "combine": "Combined mode activated",
+    "triceps": "Tricep mode activated",
+}
+
+def handle_voice_command(session, command):
+    print(f"Voice command: {command}")
+    if command == "stop":
+        speak(session, "Stopping exercise tracking")
+        session.is_running = False
+        session.voice_active = False
+    elif set_session_mode(session, command):
+        speak(session, voice_announcements[command])
 
 # Voice recognition thread
-def voice_recognition_thread():
-    global mode, voice_recognition_active
+def voice_recognition_thread(session):
+    if voice_engine == "google":
+        return google_voice_thread(session)
     
+    try:
+        if voice_input == "mic":
+            rate = SAMPLE_RATE
+            chunks = microphone_chunks(rate)
+        else:
+            rate = wav_rate(voice_input)
+            chunks = wav_chunks(voice_input, realtime=True)
+        spotter = KeywordSpotter(load_keyword_model(vosk_model_path), rate, voice_min_confidence)
+    except Exception as e:
+        print(f"Error starting voice recognition: {e}")
+        return
+    
+    try:
+        for chunk in chunks:
+            if not session.voice_active:
+                break
+            command = spotter.accept(chunk)
+            if command:
+                handle_voice_command(session, command)
+    except Exception as e:
+        print(f"Error in voice recognition: {e}")
+    finally:
+        chunks.close()
+
+def google_voice_thread(session):
     r = sr.Recognizer()
     mic = sr.Microphone()
     
     with mic as source:
         r.adjust_for_ambient_noise(source)
     
-    while voice_recognition_active:
+    while session.voice_active:
         try:
             with mic as source:
                 audio = r.listen(source, timeout=5)
@@ -200,19 +276,9 @@ def voice_recognition_thread():
             print(f"Recognized: {text}")
             
             # Process commands
-            if "normal" in text:
-                mode = "normal"
-                speak("Normal mode activated")
-            elif "combine" in text or "combined" in text:
-                mode = "combine"
-                speak("Combined mode activated")
-            elif "tricep" in text:
-                mode = "triceps"
-                speak("Tricep mode activated")
-            elif "stop" in text:
-                is_running = False
-                voice_recognition_active = False
-                speak("Stopping exercise tracking")
+            command = next((COMMANDS[word] for word in text.split() if word in COMMANDS), None)
+            if command:
+                handle_voice_command(session, command)
                 
         except sr.UnknownValueError:
             pass
@@ -221,135 +287,201 @@ def voice_recognition_thread():
         except Exception as e:
             print(f"Error in voice recognition: {e}")
 
+def get_session_id(data):
+    # Clients identify their session by session_id, falling back to their uid
+    return data.get('session_id') or data.get('uid')
+
+def workout_ref_for(session):
+    return db.collection('usersData').document(session.uid).collection('workouts').document(session.workout_id)
+
+def set_session_mode(session, new_mode):
+    if new_mode not in MODES:
+        return False
+    
+    with session.lock:
+        session.mode = new_mode
+    
+    # Update workout mode in Firestore if available
+    if session.workout_id:
+        workout_writer.update(workout_ref_for(session), {
+            'mode': new_mode
+        })
+    return True
+
 # API endpoints for Flutter app
 @app.route('/start_tracking', methods=['POST'])
 def start_tracking():
-    global is_running, counters, mode, voice_recognition_active
-    
     data = request.get_json()
     uid = data.get('uid')
     selected_mode = data.get('mode', 'normal')
     use_voice = data.get('use_voice', False)
+    tracking = data.get('tracking', tracking_default)
     
-    # Reset counters
-    counters = {
-        "left_hand": 0,
-        "right_hand": 0,
-        "combine": 0,
-        "left_tricep": 0,
-        "right_tricep": 0,
-    }
+    if selected_mode not in MODES:
+        return jsonify({'status': 'error', 'message': 'Invalid mode'})
+    if tracking not in TRACKING:
+        return jsonify({'status': 'error', 'message': 'Invalid tracking'})
+    if tracking == 'track' and inference_workers > 0:
+        return jsonify({'status': 'error', 'message': 'Tracking is not available with inference workers'})
     
-    mode = selected_mode
-    is_running = True
-    voice_recognition_active = use_voice
+    # A fresh session replaces any previous one with the same id
+    session = sessions.create(data.get('session_id'), uid=uid, mode=selected_mode)
+    session.voice_active = use_voice
+    session.set_preview(data.get('preview', False))
+    session.set_tracking(tracking)
+    if data.get('adaptive', adaptive_default):
+        session.scheduler = AdaptiveScheduler(rep_engine)
     
     # Save to Firestore Emulator
     if uid:
+        # The id is generated client side, so nothing waits on Firestore here
         workout_ref = db.collection('usersData').document(uid).collection('workouts').document()
-        workout_ref.set({
+        workout_writer.set(workout_ref, {
             'start_time': firestore.SERVER_TIMESTAMP,
-            'mode': mode,
+            'mode': session.mode,
             'status': 'in_progress'
         })
-    
-    # Track this user session
-    active_users[uid] = {
-        'start_time': time.time(),
-        'mode': mode,
-        'counters': counters.copy(),
-        'workout_id': workout_ref.id if uid else None
-    }
+        session.workout_id = workout_ref.id
+        # Cached history must not outlive the new workout's commit
+        history.invalidate(uid)
+        workout_writer.flush(callback=lambda: history.invalidate(uid))
     
     # Start voice recognition if requested
     if use_voice:
-        threading.Thread(target=voice_recognition_thread).start()
+        threading.Thread(target=voice_recognition_thread, args=(session,), daemon=True).start()
     
-    return jsonify({'status': 'success', 'message': 'Tracking started'})
+    return jsonify({'status': 'success', 'message': 'Tracking started', 'session_id': session.session_id})
 
 @app.route('/stop_tracking', methods=['POST'])
 def stop_tracking():
-    global is_running, voice_recognition_active
-    
     data = request.get_json()
-    uid = data.get('uid')
+    session = sessions.get(get_session_id(data))
     
-    is_running = False
-    voice_recognition_active = False
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Tracking not started'})
     
-    # Store final counters for this user
-    if uid in active_users:
-        active_users[uid]['end_time'] = time.time()
-        active_users[uid]['duration'] = active_users[uid]['end_time'] - active_users[uid]['start_time']
-        active_users[uid]['final_counters'] = counters.copy()
-        
-        # Update Firestore with final results
-        if active_users[uid].get('workout_id'):
-            workout_ref = db.collection('usersData').document(uid).collection('workouts').document(active_users[uid]['workout_id'])
-            workout_ref.update({
-                'end_time': firestore.SERVER_TIMESTAMP,
-                'status': 'completed',
-                'stats': {
-                    'left_count': counters['left_hand'],
-                    'right_count': counters['right_hand'],
-                    'combined_count': counters['combine'],
-                    'left_tricep_count': counters['left_tricep'],
-                    'right_tricep_count': counters['right_tricep'],
-                    'duration': firestore.Increment(active_users[uid]['duration'])
-                }
-            })
-    
-    return jsonify({'status': 'success', 'message': 'Tracking stopped'})
+    with session.lock:
+        # Only the first stop finalizes the workout
+        finalize = session.end_time is None
+        session.is_running = False
+        session.voice_active = False
+        session.set_preview(False)
+        if finalize:
+            session.end_time = time.time()
+        counters = dict(session.counters)
+    
+    # Update Firestore with final results
+    if finalize and session.workout_id:
+        stats = {
+            'left_count': counters['left_hand'],
+            'right_count': counters['right_hand'],
+            'combined_count': counters['combine'],
+            'left_tricep_count': counters['left_tricep'],
+            'right_tricep_count': counters['right_tricep'],
+        }
+        workout_writer.update(workout_ref_for(session), {
+            'end_time': firestore.SERVER_TIMESTAMP,
+            'status': 'completed',
+            'stats': dict(stats, duration=firestore.Increment(session.duration()))
+        })
+        history.record_workout(session.uid, session.start_time, dict(stats, duration=session.duration()))
+        # Push this workout's buffered reps and results out now, without
+        # waiting; cached history is dropped now and again once it's committed
+        history.invalidate(session.uid)
+        workout_writer.flush(callback=lambda: history.invalidate(session.uid))
+    
+    return jsonify({'status': 'success', 'message': 'Tracking stopped', 'counters': counters})
 
 @app.route('/change_mode', methods=['POST'])
 def change_mode():
-    global mode
-    
     data = request.get_json()
     new_mode = data.get('mode')
-    uid = data.get('uid')
+    session = sessions.get(get_session_id(data))
     
-    if new_mode in ['normal', 'combine', 'triceps']:
-        mode = new_mode
-        
-        # Update workout mode in Firestore if available
-        if uid in active_users and active_users[uid].get('workout_id'):
-            workout_ref = db.collection('usersData').document(uid).collection('workouts').document(active_users[uid]['workout_id'])
-            workout_ref.update({
-                'mode': mode
-            })
-            
-        return jsonify({'status': 'success', 'message': f'Mode changed to {mode}'})
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Tracking not started'})
+    
+    if set_session_mode(session, new_mode):
+        return jsonify({'status': 'success', 'message': f'Mode changed to {new_mode}'})
     else:
         return jsonify({'status': 'error', 'message': 'Invalid mode'})
 
 @app.route('/tracking_status', methods=['GET'])
 def tracking_status():
-    return jsonify({
-        'is_running': is_running,
-        'mode': mode,
-        'counters': counters,
-        'angles': angles
-    })
+    session = sessions.get(get_session_id(request.args))
+    
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Tracking not started', 'is_running': False})
+    
+    return jsonify(session.status())
 
 @app.route('/toggle_voice', methods=['POST'])
 def toggle_voice():
-    global voice_recognition_active
-    
     data = request.get_json()
     enable = data.get('enable', False)
+    session = sessions.get(get_session_id(data))
+    
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Tracking not started'})
     
-    if enable and not voice_recognition_active:
-        voice_recognition_active = True
-        threading.Thread(target=voice_recognition_thread).start()
+    if enable and not session.voice_active:
+        session.voice_active = True
+        threading.Thread(target=voice_recognition_thread, args=(session,), daemon=True).start()
     elif not enable:
-        voice_recognition_active = False
+        session.voice_active = False
     
     return jsonify({
         'status': 'success',
-        'voice_active': voice_recognition_active
+        'voice_active': session.voice_active
     })
 
+@app.route('/toggle_preview', methods=['POST'])
+def toggle_preview():
+    data = request.get_json()
+    session = sessions.get(get_session_id(data))
+    
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Tracking not started'})
+    
+    with session.lock:
+        session.set_preview(data.get('enable', False))
+    
+    return jsonify({'status': 'success', 'preview_active': session.preview})
+
+@app.route('/preview_frame', methods=['GET'])
+def preview_frame():
+    session = sessions.get(get_session_id(request.args))
+    
+    if session is None or not session.preview:
+        return jsonify({'status': 'error', 'message': 'Preview not enabled'}), 404
+    
+    started = time.perf_counter()
+    jpeg = render_preview(session)
+    if jpeg is None:
+        return jsonify({'status': 'error', 'message': 'No frame yet'}), 404
+    stage_seconds.labels('annotate').observe(time.perf_counter() - started)
+    
+    return Response(jpeg, mimetype='image/jpeg')
+
+@app.route('/preview_stream', methods=['GET'])
+def preview_stream():
+    # MJPEG stream of annotated frames, rendered only while someone watches
+    session = sessions.get(get_session_id(request.args))
+    
+    if session is None or not session.preview:
+        return jsonify({'status': 'error', 'message': 'Preview not enabled'}), 404
+    
+    def generate():
+        while session.preview and session.is_running:
+            started = time.perf_counter()
+            jpeg = render_preview(session)
+            if jpeg is not None:
+                stage_seconds.labels('annotate').observe(time.perf_counter() - started)
+                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+            time.sleep(0.1)
+    
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
 @app.route('/user_workouts', methods=['GET'])
 def user_workouts():
     uid = request.args.get('uid')
@@ -358,63 +490,272 @@ def user_workouts():
         return jsonify({'status': 'error', 'message': 'User ID required'})
     
     try:
-        workouts = []
-        workouts_ref = db.collection('usersData').document(uid).collection('workouts').order_by('start_time', direction=firestore.Query.DESCENDING).limit(10)
-        docs = workouts_ref.stream()
-        
-        for doc in docs:
-            workout_data = doc.to_dict()
-            workout_data['id'] = doc.id
-            
-            # Convert timestamps to strings for JSON
-            if 'start_time' in workout_data and workout_data['start_time']:
-                workout_data['start_time'] = workout_data['start_time'].strftime('%Y-%m-%d %H:%M:%S')
-            if 'end_time' in workout_data and workout_data['end_time']:
-                workout_data['end_time'] = workout_data['end_time'].strftime('%Y-%m-%d %H:%M:%S')
-                
-            workouts.append(workout_data)
-            
-        return jsonify({'status': 'success', 'workouts': workouts})
+        # Newest first; pass the returned next_cursor as ?cursor= for the
+        # following page (null on the last one)
+        page = history.page(uid, request.args.get('cursor'), request.args.get('limit', type=int))
+        return jsonify({'status': 'success', **page})
+    except InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/user_stats', methods=['GET'])
+def user_stats():
+    uid = request.args.get('uid')
+    
+    if not uid:
+        return jsonify({'status': 'error', 'message': 'User ID required'})
+    
+    try:
+        # Lifetime and per-week totals from the rollup documents
+        summary = history.summary(uid, request.args.get('weeks', 8, type=int))
+        return jsonify({'status': 'success', **summary})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def request_session_id():
+    if request.mimetype == 'multipart/form-data':
+        return get_session_id(request.form) or get_session_id(request.args)
+    if request.is_json:
+        return get_session_id(request.get_json())
+    # Raw bodies carry the session in the query string
+    return get_session_id(request.args)
+
+def decode_request_frame():
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if upload is None:
+            return None
+        stream = upload.stream
+        stream.seek(0, os.SEEK_END)
+        length = stream.tell()
+        stream.seek(0)
+        return decode_stream(stream, length)
+    
+    if request.is_json:
+        base64_image = request.get_json().get('image')
+        return decode_base64(base64_image) if base64_image else None
+    
+    if not request.content_length:
+        return None
+    return decode_stream(request.stream, request.content_length)
+
 # NEW: Process frames from mobile camera
+# Accepts JSON with a base64 'image', a raw JPEG/PNG body
+# (application/octet-stream or image/*) or multipart/form-data with an
+# 'image' file part. Frames already sized 720x480 skip the resize.
 @app.route('/process_frame', methods=['POST'])
 def mobile_frame_processing():
-    global is_running
-    
-    if not is_running:
-        return jsonify({'status': 'error', 'message': 'Tracking not started'})
-    
+    started = time.perf_counter()
+    timings = {}
     try:
-        data = request.get_json()
-        base64_image = data.get('image')
+        session = sessions.get(request_session_id())
         
-        if not base64_image:
-            return jsonify({'status': 'error', 'message': 'No image data provided'})
+        if session is None or not session.is_running:
+            return jsonify({'status': 'error', 'message': 'Tracking not started'})
         
-        # Decode base64 image
-        image_data = base64.b64decode(base64_image.split(',')[1] if ',' in base64_image else base64_image)
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv.imdecode(nparr, cv.IMREAD_COLOR)
+        frame = decode_request_frame()
+        timings['decode'] = time.perf_counter() - started
         
         if frame is None:
+            observe_frame('http', timings, started, 'invalid')
             return jsonify({'status': 'error', 'message': 'Invalid image data'})
         
         # Process the frame
-        process_frame(frame)
+        with session.lock:
+            process_frame(session, frame, timings)
+            status = session.status()
+        observe_frame('http', timings, started)
         
         # Return current counters and status
         return jsonify({
             'status': 'success',
-            'counters': counters,
-            'angles': angles,
-            'mode': mode
+            'counters': status['counters'],
+            'angles': status['angles'],
+            'mode': status['mode']
         })
         
+    except FrameTooLarge as e:
+        observe_frame('http', timings, started, 'too_large')
+        return jsonify({'status': 'error', 'message': str(e)}), 413
+    except ModelNotReady as e:
+        observe_frame('http', timings, started, 'not_ready')
+        return jsonify({'status': 'error', 'message': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
+        observe_frame('http', timings, started, 'error')
         print(f"Error processing frame: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+# Streaming mode: one WebSocket per tracking session. The client sends
+# binary JPEG/PNG frames and JSON text commands ({"type": "change_mode",
+# "mode": ...}); the server pushes a "rep" event for every counted rep and a
+# "status" message after every processed frame.
+def stream_worker(session, slot, send):
+    try:
+        while True:
+            data = slot.take()
+            if data is None:
+                break
+            
+            started = time.perf_counter()
+            frame = decode_bytes(data)
+            timings = {'decode': time.perf_counter() - started}
+            if frame is None:
+                observe_frame('websocket', timings, started, 'invalid')
+                send({'type': 'error', 'message': 'Invalid image data'})
+                continue
+            
+            with session.lock:
+                if not session.is_running:
+                    break
+                before = dict(session.counters)
+                try:
+                    process_frame(session, frame, timings)
+                except ModelNotReady as e:
+                    observe_frame('websocket', timings, started, 'not_ready')
+                    send({'type': 'error', 'message': str(e)})
+                    continue
+                except Exception as e:
+                    # One bad frame (a dead pose worker, a batcher timeout)
+                    # must not end the stream
+                    observe_frame('websocket', timings, started, 'error')
+                    print(f"Error processing frame: {e}")
+                    send({'type': 'error', 'message': str(e)})
+                    continue
+                status = session.status()
+            observe_frame('websocket', timings, started)
+            # Long-lived streams never go through sessions.get()
+            session.touch()
+            
+            for name, count in status['counters'].items():
+                if count > before[name]:
+                    send({'type': 'rep', 'counter': name, 'count': count})
+            send({'type': 'status', 'dropped': slot.dropped, **status})
+    except ConnectionClosed:
+        pass
+    except Exception as e:
+        print(f"Error in tracking stream: {e}")
+    finally:
+        slot.close()
+        # Replaced by a newer frame before the worker got to them
+        frames_total.labels('websocket', 'dropped').inc(slot.dropped)
+
+@sock.route('/ws/track')
+def tracking_stream(ws):
+    session = sessions.get(get_session_id(request.args))
+    
+    if session is None or not session.is_running:
+        ws.send(json.dumps({'type': 'error', 'message': 'Tracking not started'}))
+        return
+    
+    send_lock = threading.Lock()
+    
+    def send(message):
+        with send_lock:
+            ws.send(json.dumps(message))
+    
+    slot = LatestFrameSlot()
+    worker = threading.Thread(target=stream_worker, args=(session, slot, send), daemon=True)
+    worker.start()
+    
+    try:
+        while session.is_running:
+            if not worker.is_alive():
+                # Frames would only pile up in the slot from here on
+                send({'type': 'error', 'message': 'Tracking stream failed'})
+                return
+            message = ws.receive(timeout=1)
+            if message is None:
+                continue
+            
+            if isinstance(message, (bytes, bytearray)):
+                # Decoded by the worker so frames that get replaced cost nothing
+                slot.put(message)
+                continue
+            
+            try:
+                command = json.loads(message)
+                kind = command.get('type')
+            except (ValueError, AttributeError):
+                # Malformed JSON or not an object; the stream stays open
+                send({'type': 'error', 'message': 'Invalid command'})
+                continue
+            if kind == 'change_mode':
+                if set_session_mode(session, command.get('mode')):
+                    send({'type': 'status', **session.status()})
+                else:
+                    send({'type': 'error', 'message': 'Invalid mode'})
+            elif kind == 'status':
+                send({'type': 'status', 'dropped': slot.dropped, **session.status()})
+        
+        send({'type': 'stopped', **session.status()})
+    except ConnectionClosed:
+        pass
+    finally:
+        slot.close()
+        worker.join(timeout=5)
+
+# Liveness: the process is up and serving requests
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok'})
+
+# Readiness: the pose model is loaded and warmed up
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = models.status()
+    if pose_pool is not None:
+        status['pose_workers'] = pose_pool.stats()
+        if not status['pose_workers']['ready']:
+            # Every worker died after startup
+            status['ready'] = False
+    if backend_selection:
+        status['pose_backend'] = backend_selection
+    return jsonify(status), 200 if status['ready'] else 503
+
+# Prometheus scrape endpoint: per-stage latency histograms, frame and rep
+# counters, queue depth gauges
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+# Runtime profiler control: POST {"action": "start" | "stop" | "reset",
+# "interval": seconds}; GET returns collapsed stacks for a flame graph
+# (?format=json for the profiler status)
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    if not profiler_enabled:
+        return jsonify({'status': 'error', 'message': 'Profiler disabled'}), 404
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            interval = data.get('interval')
+            if interval is not None:
+                # A bad interval would kill the sampler thread, not this request
+                try:
+                    interval = float(interval)
+                except (TypeError, ValueError):
+                    interval = 0.0
+                if not 0 < interval < float('inf'):
+                    return jsonify({'status': 'error', 'message': 'Invalid interval'}), 400
+            profiler.start(interval)
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({'status': 'error', 'message': 'Invalid action'}), 400
+        return jsonify(profiler.status())
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.status())
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+# Under the debug reloader only the serving child process loads the model.
+# Pose worker processes load their own.
+if app_process and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    models.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5050, debug=True)
@@ -0,0 +1,121 @@
+import time
+
+import cv2 as cv
+import numpy as np
+
+from frames import fit_frame
+from rep_engine import RepEngine
+
+# Configure thresholds
+thresholds = {
+    "bicep_up": 170,
+    "bicep_down": 45,
+    "tricep_up": 170,
+    "tricep_down": 90
+}
+
+
+class FramePipeline:
+    # The per-frame path shared by /process_frame, the WebSocket stream and
+    # the offline replay harness: resize, pose inference, angles and reps.
+    # `infer(frame, session)` maps a 720x480 frame to one ultralytics
+    # Results object (or anything with the same keypoints.xy), and
+    # `speak(session, text, key)` receives rep announcements and
+    # `on_rep(session, rep)` every counted RepEvent. When a `timings` dict is
+    # passed, seconds spent per stage are added to it. Sessions with a
+    # smoother get their keypoints filtered at `timestamp` (seconds, defaults
+    # to the arrival time) before any angle is measured.
+    def __init__(self, infer, engine=None, speak=None, on_rep=None):
+        self.infer = infer
+        self.engine = engine or RepEngine(thresholds)
+        self.speak = speak
+        self.on_rep = on_rep
+
+    def process(self, session, frame, timings=None, timestamp=None):
+        clock = time.perf_counter()
+        
+        def lap(stage):
+            nonlocal clock
+            now = time.perf_counter()
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + now - clock
+            clock = now
+        
+        scheduler = session.scheduler
+        if scheduler is not None and not scheduler.should_infer(frame, session.mode, session.angles):
+            lap('schedule')
+            return None
+        
+        frame = fit_frame(frame)
+        lap('resize')
+        result = self.infer(frame, session)
+        lap('inference')
+        keypoints = None
+        
+        if result.keypoints is not None:
+            keypoints = result.keypoints.xy
+            if not isinstance(keypoints, np.ndarray):
+                keypoints = keypoints.cpu().numpy()
+            if session.smoother is not None:
+                keypoints = session.smoother.update(keypoints, time.monotonic() if timestamp is None else timestamp)
+                lap('smooth')
+            
+            # Angles for every person come from one vectorized call; the
+            # exercise table in rep_engine drives the per-mode state machines
+            angles, reps = self.engine.step(session.mode, session.states, session.counters, keypoints)
+            if angles is not None:
+                session.angles["left"] = int(angles["left"])
+                session.angles["right"] = int(angles["right"])
+            for rep in reps:
+                if self.on_rep is not None:
+                    self.on_rep(session, rep)
+                if self.speak is not None:
+                    self.speak(session, rep.announce, key=rep.counter)
+        
+        # Headless by default: only keep what a preview needs to render later
+        if session.preview:
+            session.current_frame = frame
+            session.current_keypoints = keypoints
+        lap('reps')
+        
+        return keypoints
+
+
+def annotate_frame(frame, keypoints, mode, counters):
+    # Draw keypoints on the frame
+    if keypoints is not None:
+        for keypoint in keypoints:
+            for i, point in enumerate(keypoint):
+                cx, cy = int(point[0]), int(point[1])
+                cv.circle(frame, (cx, cy), 5, (255, 0, 0), -1)
+                cv.putText(frame, f'{i}', (cx, cy), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+                
+    # Add text to frame
+    cv.putText(frame, f"Mode: {mode}", (10, 30), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    
+    if mode == "normal":
+        cv.putText(frame, f"Left: {counters['left_hand']} Right: {counters['right_hand']}", 
+                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    elif mode == "combine":
+        cv.putText(frame, f"Combined: {counters['combine']}", 
+                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    elif mode == "triceps":
+        cv.putText(frame, f"Left Tricep: {counters['left_tricep']} Right Tricep: {counters['right_tricep']}", 
+                   (10, 60), cv.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    
+    return frame
+
+
+def render_preview(session):
+    # Annotate a copy of the latest frame on demand; None until a frame arrives
+    with session.lock:
+        if session.current_frame is None:
+            return None
+        frame = session.current_frame.copy()
+        keypoints = session.current_keypoints
+        mode = session.mode
+        counters = dict(session.counters)
+    
+    annotate_frame(frame, keypoints, mode, counters)
+    ok, jpeg = cv.imencode('.jpg', frame)
+    return jpeg.tobytes() if ok else None
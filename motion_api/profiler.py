@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    # Low-overhead wall-clock profiler that can be switched on in a running
+    # server: while started, a thread snapshots every other thread's Python
+    # stack each `interval` seconds and counts them. collapsed() returns the
+    # counts in "frame;frame;frame count" form, ready for flamegraph.pl or
+    # speedscope.
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started_at = None
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if interval:
+                self.interval = interval
+            if self.running():
+                return False
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def collapsed(self, limit=None):
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def status(self):
+        return {
+            'running': self.running(),
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': len(self._stacks),
+            'started_at': self.started_at,
+        }
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            frames = sys._current_frames()
+            stacks = [f"{names.get(ident, ident)};{self._stack(frame)}"
+                      for ident, frame in frames.items() if ident != own]
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
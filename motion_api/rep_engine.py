@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+import numpy as np
+
+# COCO keypoint triples (shoulder, elbow, wrist) for each joint angle we track
+JOINTS = {
+    "left": (5, 7, 9),
+    "right": (6, 8, 10),
+}
+
+# One rep counter. A rep is counted when every joint in `joints` crosses the
+# `enter` threshold while the state is off, and the state re-arms once every
+# joint crosses the `exit` threshold. Thresholds are names in the thresholds
+# dict; `inclusive` switches the comparisons from < / > to <= / >=, and each
+# crossing must clear its threshold by `hysteresis` extra degrees. The curls
+# and extensions below keep 0: their enter and exit thresholds are already
+# 80 to 125 degrees apart, so jitter at one of them can't re-arm the rep.
+RepRule = namedtuple('RepRule', ['counter', 'state', 'joints', 'enter', 'exit', 'inclusive', 'announce',
+                                 'hysteresis'])
+
+EXERCISES = {
+    "normal": [
+        RepRule("left_hand", "push_up_left", ("left",), ("below", "bicep_down"), ("above", "bicep_up"), False, "left {count}", 0),
+        RepRule("right_hand", "push_up_right", ("right",), ("below", "bicep_down"), ("above", "bicep_up"), False, "right {count}", 0),
+    ],
+    "combine": [
+        RepRule("combine", "combine", ("left", "right"), ("below", "bicep_down"), ("above", "bicep_up"), True, "combine {count}", 0),
+    ],
+    "triceps": [
+        RepRule("left_tricep", "tricep_push_left", ("left",), ("above", "tricep_up"), ("below", "tricep_down"), False, "left tricep {count}", 0),
+        RepRule("right_tricep", "tricep_push_right", ("right",), ("above", "tricep_up"), ("below", "tricep_down"), False, "right tricep {count}", 0),
+    ],
+}
+
+RepEvent = namedtuple('RepEvent', ['counter', 'count', 'angle', 'announce'])
+
+
+def joint_angles(keypoints, triples):
+    # keypoints: (people, points, 2); triples: (joints, 3) keypoint indices.
+    # Returns (people, joints) angles in degrees, all people in one pass.
+    # Coordinates are truncated to whole pixels like the original per-person code.
+    kp = keypoints.astype(np.int32).astype(np.float64)
+    a = kp[:, triples[:, 0]]
+    b = kp[:, triples[:, 1]]
+    c = kp[:, triples[:, 2]]
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+               - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angles = np.abs(np.degrees(radians))
+    return np.where(angles > 180.0, 360.0 - angles, angles)
+
+
+class RepEngine:
+    def __init__(self, thresholds, exercises=EXERCISES, joints=JOINTS):
+        self.thresholds = thresholds
+        self.exercises = exercises
+        self.joint_names = list(joints)
+        self.joint_col = {name: i for i, name in enumerate(self.joint_names)}
+        self.triples = np.array([joints[name] for name in self.joint_names])
+        self.min_points = int(self.triples.max()) + 1
+
+    def angles(self, keypoints):
+        return joint_angles(keypoints, self.triples)
+
+    def limit(self, rule, side):
+        # The angle a crossing of `side` (rule.enter or rule.exit) must pass
+        direction, name = side
+        if direction == "below":
+            return self.thresholds[name] - rule.hysteresis
+        return self.thresholds[name] + rule.hysteresis
+
+    def _crossed(self, angles, rule, side):
+        cols = [self.joint_col[joint] for joint in rule.joints]
+        values = angles[:, cols]
+        limit = self.limit(rule, side)
+        if side[0] == "below":
+            hit = values <= limit if rule.inclusive else values < limit
+        else:
+            hit = values >= limit if rule.inclusive else values > limit
+        return np.all(hit, axis=1)
+
+    def step(self, mode, states, counters, keypoints):
+        # Advances the mode's state machines over every detected person in
+        # order, updating states/counters in place. Returns the last person's
+        # angles by joint name and the reps counted on this frame.
+        if keypoints is None or len(keypoints) == 0 or keypoints.shape[1] < self.min_points:
+            return None, []
+
+        angles = self.angles(keypoints)
+        rules = self.exercises.get(mode, [])
+        enters = [self._crossed(angles, rule, rule.enter) for rule in rules]
+        exits = [self._crossed(angles, rule, rule.exit) for rule in rules]
+
+        events = []
+        for person in range(len(angles)):
+            for rule, entered, exited in zip(rules, enters, exits):
+                if entered[person] and not states[rule.state]:
+                    states[rule.state] = True
+                    counters[rule.counter] += 1
+                    count = counters[rule.counter]
+                    peak = {joint: float(angles[person, self.joint_col[joint]]) for joint in rule.joints}
+                    events.append(RepEvent(rule.counter, count, peak, rule.announce.format(count=count)))
+                elif exited[person] and states[rule.state]:
+                    states[rule.state] = False
+
+        last = angles[-1]
+        return {name: float(last[i]) for i, name in enumerate(self.joint_names)}, events
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2 as cv
+import numpy as np
+from ultralytics import YOLO
+
+from frames import decode_bytes
+from model_registry import infer_pose
+from pipeline import FramePipeline, annotate_frame
+from scheduler import AdaptiveScheduler
+from sessions import MODES, TRACKING, TrackingSession
+
+# Offline replay of recorded sessions through the same pipeline as
+# /process_frame, without a camera, Flask, Firestore or a speaker.
+#
+#   python replay.py clips/curls.mp4 clips/triceps/ --truth truth.json
+#
+# Inputs are video files or directories of images (replayed in name order).
+# Every frame is JPEG-encoded first so the decode stage costs what an upload
+# would. The ground truth file maps each input's base name to its mode and
+# expected counters:
+#
+#   {"curls.mp4": {"mode": "normal", "counters": {"left_hand": 12, "right_hand": 12}}}
+#
+# --infer compares the ways of following the athlete (sessions.TRACKING) on
+# the same clips, e.g. per-frame cost and rep error of
+#
+#   python replay.py clips/ --truth truth.json --infer track
+#   python replay.py clips/ --truth truth.json --infer smooth
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+STAGES = ('decode', 'schedule', 'resize', 'inference', 'smooth', 'reps', 'annotate')
+
+
+def iter_frames(path, stride=1, limit=None):
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTS))
+        frames = (cv.imread(os.path.join(path, n)) for n in names)
+    else:
+        frames = _video_frames(path)
+
+    count = 0
+    for index, frame in enumerate(frames):
+        if frame is None or index % stride:
+            continue
+        yield frame
+        count += 1
+        if limit and count >= limit:
+            break
+
+
+def _video_frames(path):
+    cap = cv.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {path}")
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def make_infer(model, method):
+    return lambda frame, session=None: infer_pose(model, frame, method)
+
+
+def replay(pipeline, path, mode, args):
+    session = TrackingSession(os.path.basename(os.path.normpath(path)), mode=mode)
+    session.voice_active = True
+    session.set_tracking(args.infer)
+    if args.adaptive:
+        session.scheduler = AdaptiveScheduler(pipeline.engine)
+
+    stage_times = {stage: [] for stage in STAGES}
+    frame_times = []
+    for index, raw in enumerate(iter_frames(path, args.stride, args.limit)):
+        ok, encoded = cv.imencode('.jpg', raw, [cv.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
+        if not ok:
+            continue
+        timings = {}
+        start = time.perf_counter()
+
+        frame = decode_bytes(encoded)
+        timings['decode'] = time.perf_counter() - start
+        # Smoothing runs on the clip's clock, not the replay speed
+        keypoints = pipeline.process(session, frame, timings, timestamp=index * args.stride / args.fps)
+        if args.annotate and keypoints is not None:
+            t0 = time.perf_counter()
+            annotate_frame(frame.copy(), keypoints, session.mode, session.counters)
+            timings['annotate'] = time.perf_counter() - t0
+
+        frame_times.append(time.perf_counter() - start)
+        for stage, seconds in timings.items():
+            stage_times[stage].append(seconds)
+
+    return session, frame_times, stage_times
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ms = np.array(values) * 1000
+    return {
+        'count': len(values),
+        'p50': float(np.percentile(ms, 50)),
+        'p95': float(np.percentile(ms, 95)),
+        'p99': float(np.percentile(ms, 99)),
+    }
+
+
+def compare(counters, expected):
+    rows = {}
+    for name, want in expected.items():
+        got = counters.get(name, 0)
+        rows[name] = {'expected': want, 'counted': got, 'error': got - want}
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions through the motion pipeline")
+    parser.add_argument('inputs', nargs='+', help="Video files or image directories")
+    parser.add_argument('--model', default="./yolo11n-pose.pt")
+    parser.add_argument('--truth', help="Ground truth JSON (see module comment)")
+    parser.add_argument('--mode', default="normal", choices=MODES, help="Mode for inputs without ground truth")
+    parser.add_argument('--infer', default="predict", choices=TRACKING)
+    parser.add_argument('--adaptive', action='store_true', help="Enable adaptive inference scheduling")
+    parser.add_argument('--annotate', action='store_true', help="Also time frame annotation")
+    parser.add_argument('--stride', type=int, default=1, help="Use every Nth frame (e.g. 6 for 30fps video at 5fps)")
+    parser.add_argument('--limit', type=int, help="Max frames per input")
+    parser.add_argument('--fps', type=float, default=30, help="Frame rate of the inputs, for smoothing")
+    parser.add_argument('--jpeg-quality', type=int, default=90)
+    parser.add_argument('--tts-log', help="Write rep announcements to this file")
+    parser.add_argument('--json', help="Write the full report to this file")
+    parser.add_argument('--max-rep-error', type=int, default=None,
+                        help="Exit non-zero if any counter is off by more than this")
+    args = parser.parse_args()
+
+    truth = {}
+    if args.truth:
+        with open(args.truth, encoding='utf-8') as f:
+            truth = json.load(f)
+
+    announcements = []
+
+    def speak(session, text, key=None):
+        # Stands in for the TTS worker
+        announcements.append(f"{session.session_id}: {text}")
+
+    model = YOLO(args.model)
+    pipeline = FramePipeline(make_infer(model, args.infer), speak=speak)
+
+    report = {'inputs': {}, 'config': vars(args)}
+    all_frames = []
+    all_stages = {stage: [] for stage in STAGES}
+    worst_error = 0
+    wall_start = time.perf_counter()
+
+    for path in args.inputs:
+        name = os.path.basename(os.path.normpath(path))
+        spec = truth.get(name, {})
+        session, frame_times, stage_times = replay(pipeline, path, spec.get('mode', args.mode), args)
+        all_frames.extend(frame_times)
+        for stage, values in stage_times.items():
+            all_stages[stage].extend(values)
+
+        entry = {
+            'frames': len(frame_times),
+            'mode': session.mode,
+            'counters': session.counters,
+            'latency_ms': percentiles(frame_times),
+        }
+        if session.scheduler is not None:
+            entry['inference'] = session.scheduler.stats()
+        if session.smoother is not None:
+            entry['switches'] = session.smoother.switches
+        if 'counters' in spec:
+            entry['accuracy'] = compare(session.counters, spec['counters'])
+            worst_error = max([worst_error] + [abs(r['error']) for r in entry['accuracy'].values()])
+        report['inputs'][name] = entry
+
+    wall = time.perf_counter() - wall_start
+    report['frames'] = len(all_frames)
+    report['fps'] = len(all_frames) / wall if wall else 0.0
+    report['stages_ms'] = {stage: percentiles(values) for stage, values in all_stages.items() if values}
+
+    print(f"Replayed {report['frames']} frames in {wall:.1f}s ({report['fps']:.1f} fps)")
+    print(f"{'stage':<10} {'n':>7} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for stage, stats in report['stages_ms'].items():
+        print(f"{stage:<10} {stats['count']:>7} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['p99']:>8.2f}")
+    for name, entry in report['inputs'].items():
+        print(f"\n{name} [{entry['mode']}] {entry['frames']} frames")
+        if 'inference' in entry:
+            print(f"  inferred {entry['inference']['inferred']}, skipped {entry['inference']['skipped']}")
+        if 'switches' in entry:
+            print(f"  athlete switches {entry['switches']}")
+        for counter, row in entry.get('accuracy', {}).items():
+            print(f"  {counter:<13} expected {row['expected']:>4}  counted {row['counted']:>4}  error {row['error']:+d}")
+
+    if args.tts_log:
+        with open(args.tts_log, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(announcements) + '\n')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_rep_error is not None and worst_error > args.max_rep_error:
+        print(f"\nRep count error {worst_error} exceeds --max-rep-error {args.max_rep_error}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import cv2 as cv
+
+
+class AdaptiveScheduler:
+    # Decides, per session, whether a frame needs a pose pass. Within
+    # near_margin degrees of a rep boundary every frame is inferred; the
+    # further the joint angles are from the thresholds of the active
+    # exercise, the more frames are skipped, up to max_skip in a row. A cheap
+    # motion check (mean absolute difference of tiny grayscale thumbnails)
+    # lets a still athlete skip away from a boundary, and pulls the interval
+    # down when moving fast. It averages over the whole frame, where a
+    # moving forearm barely registers, so it never overrides the boundary.
+    def __init__(self, engine, max_skip=4, near_margin=20, degrees_per_skip=15,
+                 still_threshold=2.0, fast_threshold=12.0, thumb_size=(64, 48)):
+        self.engine = engine
+        self.max_skip = max_skip
+        self.near_margin = near_margin
+        self.degrees_per_skip = degrees_per_skip
+        self.still_threshold = still_threshold
+        self.fast_threshold = fast_threshold
+        self.thumb_size = thumb_size
+        self.last_thumb = None
+        # Start "overdue" so the first frame always gets a pose pass
+        self.since_inference = max_skip
+        self.inferred = 0
+        self.skipped = 0
+
+    def motion(self, frame):
+        thumb = cv.resize(frame, self.thumb_size, interpolation=cv.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv.cvtColor(thumb, cv.COLOR_BGR2GRAY)
+        last, self.last_thumb = self.last_thumb, thumb
+        if last is None:
+            return float('inf')
+        return float(cv.absdiff(thumb, last).mean())
+
+    def boundary_distance(self, mode, angles):
+        # Smallest gap between a tracked joint angle and any threshold the
+        # active exercise can cross next
+        distances = []
+        for rule in self.engine.exercises.get(mode, []):
+            for side in (rule.enter, rule.exit):
+                limit = self.engine.limit(rule, side)
+                distances.extend(abs(angles[joint] - limit) for joint in rule.joints)
+        return min(distances) if distances else 0
+
+    def interval(self, mode, angles, motion):
+        distance = self.boundary_distance(mode, angles)
+        if distance <= self.near_margin:
+            return 1
+        if motion < self.still_threshold:
+            return self.max_skip + 1
+        interval = 1 + int((distance - self.near_margin) // self.degrees_per_skip)
+        if motion > self.fast_threshold:
+            interval = (interval + 1) // 2
+        return max(1, min(interval, self.max_skip + 1))
+
+    def should_infer(self, frame, mode, angles):
+        motion = self.motion(frame)
+        if self.since_inference + 1 >= self.interval(mode, angles, motion):
+            self.since_inference = 0
+            self.inferred += 1
+            return True
+        self.since_inference += 1
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        total = self.inferred + self.skipped
+        return {
+            'inferred': self.inferred,
+            'skipped': self.skipped,
+            'inference_ratio': self.inferred / total if total else 1.0,
+        }
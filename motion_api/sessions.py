@@ -0,0 +1,172 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from smoothing import KeypointSmoother
+
+MODES = ('normal', 'combine', 'triceps')
+# How the athlete is followed between frames:
+#   predict - plain pose prediction, every detected person counts
+#   smooth  - plain prediction plus a per-session keypoint filter that
+#             follows one athlete (see smoothing.KeypointSmoother)
+#   track   - ultralytics' multi-object tracker, the original path
+TRACKING = ('predict', 'smooth', 'track')
+
+
+def new_counters():
+    return {
+        "left_hand": 0,
+        "right_hand": 0,
+        "combine": 0,
+        "left_tricep": 0,
+        "right_tricep": 0,
+    }
+
+
+def new_states():
+    return {
+        "push_up_left": False,
+        "push_up_right": False,
+        "combine": False,
+        "tricep_push_left": False,
+        "tricep_push_right": False,
+    }
+
+
+class TrackingSession:
+    # Everything one athlete's tracking run needs; previously module globals
+    def __init__(self, session_id, uid=None, mode="normal"):
+        self.session_id = session_id
+        self.uid = uid
+        self.mode = mode
+        self.counters = new_counters()
+        self.states = new_states()
+        self.angles = {"left": 0, "right": 0}
+        self.is_running = True
+        self.voice_active = False
+        self.workout_id = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.last_seen = self.start_time
+        # Annotated previews are opt-in; headless sessions never keep frames
+        self.preview = False
+        self.current_frame = None
+        self.current_keypoints = None
+        # Optional AdaptiveScheduler that lets idle frames skip inference
+        self.scheduler = None
+        self.tracking = 'predict'
+        self.smoother = None
+        # Serializes frames and control calls that touch this session
+        self.lock = threading.RLock()
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    def set_preview(self, enable):
+        self.preview = enable
+        if not enable:
+            self.current_frame = None
+            self.current_keypoints = None
+
+    def set_tracking(self, tracking):
+        self.tracking = tracking
+        self.smoother = KeypointSmoother() if tracking == 'smooth' else None
+
+    def duration(self):
+        return (self.end_time or time.time()) - self.start_time
+
+    def status(self):
+        status = {
+            'session_id': self.session_id,
+            'is_running': self.is_running,
+            'mode': self.mode,
+            'tracking': self.tracking,
+            'counters': dict(self.counters),
+            'angles': dict(self.angles),
+        }
+        if self.scheduler is not None:
+            status['inference'] = self.scheduler.stats()
+        if self.smoother is not None:
+            status['switches'] = self.smoother.switches
+        return status
+
+
+class SessionStore:
+    # Bounded map of session id -> TrackingSession. Sessions that have not
+    # been touched for idle_timeout seconds are dropped, and when the store is
+    # full the least recently used session makes room for the new one.
+    def __init__(self, max_sessions=64, idle_timeout=600, on_evict=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id=None, uid=None, mode="normal"):
+        session_id = session_id or uid or str(uuid.uuid4())
+        session = TrackingSession(session_id, uid=uid, mode=mode)
+        evicted = []
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old is not None:
+                evicted.append(old)
+            evicted.extend(self._evict_idle_locked())
+            while len(self._sessions) >= self.max_sessions:
+                _, lru = self._sessions.popitem(last=False)
+                evicted.append(lru)
+            self._sessions[session_id] = session
+        self._notify(evicted)
+        return session
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.last_seen > self.idle_timeout:
+                del self._sessions[session_id]
+                evicted = [session]
+                session = None
+            else:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+                evicted = []
+        self._notify(evicted)
+        return session
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session
+
+    def evict_idle(self):
+        with self._lock:
+            evicted = self._evict_idle_locked()
+        self._notify(evicted)
+        return len(evicted)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_idle_locked(self):
+        cutoff = time.time() - self.idle_timeout
+        stale = [sid for sid, s in self._sessions.items() if s.last_seen < cutoff]
+        return [self._sessions.pop(sid) for sid in stale]
+
+    def _notify(self, evicted):
+        for session in evicted:
+            session.is_running = False
+            session.voice_active = False
+            if self.on_evict:
+                try:
+                    self.on_evict(session)
+                except Exception as e:
+                    print(f"Error evicting session {session.session_id}: {e}")
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+
+
+def _alpha(cutoff, dt):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    # One-Euro filter (Casiez et al., CHI 2012) over an array of
+    # coordinates: a low-pass filter whose cutoff rises with speed, so
+    # keypoint jitter while the arm is still is smoothed away but a real
+    # curl keeps little lag. Cutoffs are in Hz, beta in 1/pixel.
+    def __init__(self, min_cutoff=4.0, beta=0.1, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = None
+        self.t = None
+        self.seen = None
+
+    def __call__(self, x, t, mask=None):
+        # mask marks the entries that were observed; the rest keep their
+        # previous filtered value, and entries seen for the first time start
+        # from the observation
+        observed = np.ones(x.shape, dtype=bool) if mask is None else np.broadcast_to(mask, x.shape)
+        if self.x is None:
+            self.x, self.dx, self.t = x.copy(), np.zeros_like(x), t
+            self.seen = observed.copy()
+            return x.copy()
+
+        dt = max(t - self.t, 1e-3)
+        a_d = _alpha(self.d_cutoff, dt)
+        dx = a_d * (x - self.x) / dt + (1 - a_d) * self.dx
+        cutoff = self.min_cutoff + self.beta * np.abs(dx)
+        a = 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+        filtered = a * x + (1 - a) * self.x
+
+        new = observed & ~self.seen
+        filtered = np.where(new, x, np.where(observed, filtered, self.x))
+        dx = np.where(new, 0.0, np.where(observed, dx, self.dx))
+        self.seen |= observed
+        self.x, self.dx, self.t = filtered, dx, t
+        return filtered.copy()
+
+
+def keypoint_box(person):
+    # Bounding box (x1, y1, x2, y2) of the detected keypoints; YOLO reports
+    # undetected ones as (0, 0)
+    visible = person[(person != 0).any(axis=-1)]
+    if len(visible) == 0:
+        return None
+    return (*visible.min(axis=0), *visible.max(axis=0))
+
+
+def box_iou(a, b):
+    if a is None or b is None:
+        return 0.0
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_area(box):
+    return 0.0 if box is None else (box[2] - box[0]) * (box[3] - box[1])
+
+
+class KeypointSmoother:
+    # Per-session replacement for the tracker: follows one athlete from
+    # frame to frame and smooths their keypoints. The athlete is the person
+    # whose keypoint box overlaps the previous one most (IoU >= min_iou);
+    # when nobody does, or after max_gap seconds without a frame, the
+    # largest person in view is picked up and the filter starts over.
+    # update() returns only that person, shape (1, points, 2).
+    def __init__(self, min_cutoff=4.0, beta=0.1, d_cutoff=1.0, min_iou=0.2, max_gap=1.0):
+        self.filter = OneEuroFilter(min_cutoff, beta, d_cutoff)
+        self.min_iou = min_iou
+        self.max_gap = max_gap
+        self.box = None
+        self.last_t = None
+        self.switches = 0
+
+    def reset(self):
+        self.filter.reset()
+        self.box = None
+        self.last_t = None
+
+    def select(self, keypoints):
+        boxes = [keypoint_box(person) for person in keypoints]
+        if self.box is not None:
+            overlaps = [box_iou(self.box, box) for box in boxes]
+            best = int(np.argmax(overlaps))
+            if overlaps[best] >= self.min_iou:
+                return best, boxes[best], False
+        areas = [box_area(box) for box in boxes]
+        best = int(np.argmax(areas))
+        if areas[best] <= 0:
+            return None, None, False
+        return best, boxes[best], True
+
+    def update(self, keypoints, t):
+        if keypoints is None or len(keypoints) == 0:
+            return keypoints
+        if self.last_t is not None and t - self.last_t > self.max_gap:
+            self.reset()
+
+        index, box, switched = self.select(keypoints)
+        if index is None:
+            return keypoints[:0]
+        if switched:
+            if self.box is not None:
+                self.switches += 1
+            self.filter.reset()
+
+        person = keypoints[index].astype(np.float64)
+        observed = (person != 0).any(axis=-1, keepdims=True)
+        smoothed = self.filter(person, t, observed)
+        self.box = box
+        self.last_t = t
+        return smoothed[None].astype(np.float32)
@@ -0,0 +1,107 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class NullSink:
+    # For headless servers: announcements are accepted and discarded
+    def speak(self, text):
+        pass
+
+
+class FileSink:
+    # Appends announcements to a text file, handy for tests and replays
+    def __init__(self, path):
+        self.path = path
+
+    def speak(self, text):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"{time.time():.3f}\t{text}\n")
+
+
+class Pyttsx3Sink:
+    # pyttsx3 engines are not thread safe, so the engine is created lazily on
+    # the speech worker thread and never touched from anywhere else
+    def __init__(self, rate=150, voice_index=0):
+        self.rate = rate
+        self.voice_index = voice_index
+        self.engine = None
+
+    def speak(self, text):
+        if self.engine is None:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+            voices = self.engine.getProperty('voices')
+            if voices:
+                self.engine.setProperty('voice', voices[self.voice_index].id)
+            self.engine.setProperty('rate', self.rate)
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+
+def make_sink(spec=None):
+    # MOTION_TTS_SINK: "pyttsx3" (default), "null" or "file:<path>"
+    spec = spec or os.environ.get("MOTION_TTS_SINK", "pyttsx3")
+    if spec == "null":
+        return NullSink()
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    return Pyttsx3Sink()
+
+
+class SpeechWorker:
+    # Announcements are handed to one background thread through a bounded
+    # queue so the frame path never waits on TTS. Messages that share a key
+    # coalesce: a newer "left 7" replaces a "left 6" that hasn't been spoken
+    # yet. When the queue is full the oldest message is dropped.
+    def __init__(self, sink, max_pending=16):
+        self.sink = sink
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="speech-worker", daemon=True)
+        self._thread.start()
+
+    def say(self, text, key=None):
+        with self._cond:
+            if self._closed:
+                return
+            if key is None:
+                key = ('once', next(self._ids))
+            elif key in self._pending:
+                # Coalesce: keep the newest text but drop the stale one
+                del self._pending[key]
+                self.dropped += 1
+            while len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = text
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def close(self, timeout=5):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, text = self._pending.popitem(last=False)
+            try:
+                self.sink.speak(text)
+            except Exception as e:
+                print(f"Error in speech worker: {e}")
@@ -0,0 +1,38 @@
+import threading
+
+
+class LatestFrameSlot:
+    # Single-slot mailbox between a WebSocket reader and its processing
+    # worker. A frame that arrives while the previous one is still waiting
+    # replaces it, so a slow pipeline skips stale frames instead of queueing
+    # them up behind the camera.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._closed:
+                return
+            self.received += 1
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._cond.notify()
+
+    def take(self):
+        # Blocks for the next frame; returns None once the slot is closed
+        with self._cond:
+            while self._frame is None and not self._closed:
+                self._cond.wait()
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._frame = None
+            self._cond.notify_all()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service runs from its own directory with flat imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from firebase_admin import firestore  # noqa: E402
+
+from history import InvalidCursor, WorkoutHistory  # noqa: E402
+
+START = datetime(2026, 3, 2, 18, 0, 0)
+
+
+class FakeSnapshot:
+    def __init__(self, id, data):
+        self.id = id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    def __init__(self, collection, field, descending, after=None, count=None):
+        self.collection = collection
+        self.field = field
+        self.descending = descending
+        self.after = after
+        self.count = count
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.collection, self.field, self.descending, snapshot, self.count)
+
+    def limit(self, count):
+        return FakeQuery(self.collection, self.field, self.descending, self.after, count)
+
+    def stream(self):
+        self.collection.db.queries += 1
+        if self.collection.db.on_query:
+            self.collection.db.on_query()
+        docs = sorted(self.collection.docs.items(), key=lambda item: item[1][self.field], reverse=self.descending)
+        ids = [id for id, _ in docs]
+        if self.after is not None:
+            docs = docs[ids.index(self.after.id) + 1:]
+        return [FakeSnapshot(id, data) for id, data in docs[:self.count]]
+
+
+class FakeDocument:
+    def __init__(self, db, collection, id):
+        self.db = db
+        self.parent = collection
+        self.id = id
+
+    def collection(self, name):
+        return self.db.collection(f"{self.parent.name}/{self.id}/{name}")
+
+    def get(self):
+        return FakeSnapshot(self.id, self.parent.docs.get(self.id))
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = {}
+
+    def document(self, id):
+        return FakeDocument(self.db, self, id)
+
+    def order_by(self, field, direction=None):
+        return FakeQuery(self, field, direction == firestore.Query.DESCENDING)
+
+
+class FakeDb:
+    # Just enough of the Firestore client for WorkoutHistory.page()
+    def __init__(self):
+        self.collections = {}
+        self.queries = 0
+        self.on_query = None
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def add_workout(self, uid, id, minutes):
+        workouts = self.collection('usersData').document(uid).collection('workouts')
+        workouts.docs[id] = {'start_time': START + timedelta(minutes=minutes), 'mode': 'normal'}
+
+
+@pytest.fixture
+def db():
+    db = FakeDb()
+    for i in range(5):
+        db.add_workout('ana', f"w{i}", i)
+    return db
+
+
+def ids(page):
+    return [workout['id'] for workout in page['workouts']]
+
+
+def test_pages_follow_the_cursor_newest_first(db):
+    history = WorkoutHistory(db, writer=None)
+    first = history.page('ana', limit=2)
+    assert ids(first) == ['w4', 'w3']
+    assert first['workouts'][0]['start_time'] == '2026-03-02 18:04:00'
+    second = history.page('ana', first['next_cursor'], limit=2)
+    assert ids(second) == ['w2', 'w1']
+    last = history.page('ana', second['next_cursor'], limit=2)
+    assert ids(last) == ['w0']
+    assert last['next_cursor'] is None
+
+
+def test_unknown_cursor_is_rejected(db):
+    history = WorkoutHistory(db, writer=None)
+    with pytest.raises(InvalidCursor):
+        history.page('ana', 'missing')
+
+
+def test_pages_are_cached_until_invalidated(db):
+    history = WorkoutHistory(db, writer=None)
+    history.page('ana', limit=2)
+    db.add_workout('ana', 'w5', 5)
+    assert ids(history.page('ana', limit=2)) == ['w4', 'w3']
+    assert db.queries == 1
+    assert history.stats()['hits'] == 1
+
+    history.invalidate('ana')
+    assert ids(history.page('ana', limit=2)) == ['w5', 'w4']
+    assert db.queries == 2
+
+
+def test_load_overlapping_an_invalidation_is_not_cached(db):
+    history = WorkoutHistory(db, writer=None)
+    # The workout commits, and its invalidation lands, while the page loads
+    db.on_query = lambda: history.invalidate('ana')
+    history.page('ana', limit=2)
+    db.on_query = None
+    history.page('ana', limit=2)
+    assert db.queries == 2
+    assert history.stats()['users'] == 1
@@ -0,0 +1,97 @@
+import json
+import sys
+import types
+import wave
+
+import numpy as np
+import pytest
+
+import keywords
+from keywords import KeywordSpotter, wav_chunks
+
+
+class ScriptedRecognizer:
+    # Stands in for vosk.KaldiRecognizer: each accepted chunk plays the next
+    # scripted step, ('partial', text) or ('final', [(word, conf), ...]);
+    # FinalResult() decodes to `tail`
+    script = []
+    tail = []
+
+    def __init__(self, model, sample_rate, grammar):
+        self.grammar = json.loads(grammar)
+        self.steps = iter(self.script)
+        self.step = None
+
+    def SetWords(self, enabled):
+        pass
+
+    def AcceptWaveform(self, pcm):
+        assert len(pcm) == 2 * keywords.SAMPLE_RATE * keywords.CHUNK_MS // 1000
+        self.step = next(self.steps, ('partial', ''))
+        return self.step[0] == 'final'
+
+    def PartialResult(self):
+        return json.dumps({'partial': self.step[1]})
+
+    def Result(self):
+        return json.dumps({'result': [{'word': w, 'conf': c} for w, c in self.step[1]]})
+
+    def FinalResult(self):
+        return json.dumps({'result': [{'word': w, 'conf': c} for w, c in self.tail]})
+
+
+@pytest.fixture
+def recognizer(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'vosk', types.SimpleNamespace(KaldiRecognizer=ScriptedRecognizer))
+    return ScriptedRecognizer
+
+
+def write_wav(path, seconds, channels=1):
+    samples = np.zeros((int(keywords.SAMPLE_RATE * seconds), channels), dtype=np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(keywords.SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+    return str(path)
+
+
+def spot(path, script, recognizer, tail=(), **kwargs):
+    recognizer.script = script
+    recognizer.tail = list(tail)
+    spotter = KeywordSpotter(None, **kwargs)
+    return [spotter.accept(chunk) for chunk in wav_chunks(path)], spotter
+
+
+@pytest.mark.parametrize('channels', [1, 2])
+def test_commands_fire_once_per_utterance(tmp_path, recognizer, channels):
+    path = write_wav(tmp_path / 'commands.wav', 0.8, channels)
+    heard, spotter = spot(path, [
+        ('partial', 'tricep'),
+        ('partial', 'tricep'),                 # stable: fires early
+        ('partial', 'tricep'),
+        ('final', [('tricep', 0.95)]),        # same utterance, not again
+        ('partial', 'stop'),
+        ('final', [('stop', 0.9)]),           # one partial, fires at the end
+        ('final', [('normal', 0.3)]),         # not confident enough
+        ('final', [('[unk]', 1.0)]),
+    ], recognizer)
+    assert heard == [None, 'triceps', None, None, None, 'stop', None, None]
+    assert set(spotter.recognizer.grammar) == set(keywords.COMMANDS) | {'[unk]'}
+
+
+def test_finish_decodes_the_last_utterance(tmp_path, recognizer):
+    path = write_wav(tmp_path / 'tail.wav', 0.2)
+    # The file ends mid-utterance; without early firing only finish() hears it
+    heard, spotter = spot(path, [('partial', 'combined'), ('partial', 'combined')],
+                          recognizer, tail=[('combined', 0.8)], stable_partials=0)
+    assert heard == [None, None]
+    assert spotter.finish() == 'combine'
+
+
+def test_finish_skips_a_command_already_fired(tmp_path, recognizer):
+    path = write_wav(tmp_path / 'tail.wav', 0.2)
+    heard, spotter = spot(path, [('partial', 'stop'), ('partial', 'stop')],
+                          recognizer, tail=[('stop', 0.9)])
+    assert heard == [None, 'stop']
+    assert spotter.finish() is None
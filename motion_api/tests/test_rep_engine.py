@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+
+from pipeline import thresholds
+from rep_engine import EXERCISES, RepEngine
+from sessions import new_counters, new_states
+
+# RepEngine replaced the per-mode if/elif blocks in process_frame; it must
+# count, arm and announce exactly as they did. The old code is kept here
+# verbatim (speak() collects announcements) and both run on the same
+# random frames.
+
+
+def calculate_angle(a, b, c):
+    a = np.array(a)
+    b = np.array(b)
+    c = np.array(c)
+
+    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
+    angle = np.abs(radians*180.0/np.pi)
+
+    if angle > 180.0:
+        angle = 360-angle
+    return angle
+
+
+def old_step(mode, states, counters, angles, keypoints, spoken):
+    def speak(text):
+        spoken.append(text)
+
+    if keypoints is None:
+        return
+    for keypoint in keypoints:
+        if len(keypoint) > 0:
+            if len(keypoint) > 10:  # We need at least 11 points
+                # Extract joint positions
+                left_shoulder = (int(keypoint[5][0]), int(keypoint[5][1]))
+                left_elbow = (int(keypoint[7][0]), int(keypoint[7][1]))
+                left_wrist = (int(keypoint[9][0]), int(keypoint[9][1]))
+
+                right_shoulder = (int(keypoint[6][0]), int(keypoint[6][1]))
+                right_elbow = (int(keypoint[8][0]), int(keypoint[8][1]))
+                right_wrist = (int(keypoint[10][0]), int(keypoint[10][1]))
+
+                # Calculate angles
+                left_hand_angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
+                right_hand_angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
+
+                angles["left"] = int(left_hand_angle)
+                angles["right"] = int(right_hand_angle)
+
+                # Process based on mode
+                if mode == "normal":
+                    # Bicep curls - Left
+                    if left_hand_angle < thresholds["bicep_down"] and not states["push_up_left"]:
+                        states["push_up_left"] = True
+                        counters["left_hand"] += 1
+                        speak(f"left {counters['left_hand']}")
+                    elif left_hand_angle > thresholds["bicep_up"] and states["push_up_left"]:
+                        states["push_up_left"] = False
+
+                    # Bicep curls - Right
+                    if right_hand_angle < thresholds["bicep_down"] and not states["push_up_right"]:
+                        states["push_up_right"] = True
+                        counters["right_hand"] += 1
+                        speak(f"right {counters['right_hand']}")
+                    elif right_hand_angle > thresholds["bicep_up"] and states["push_up_right"]:
+                        states["push_up_right"] = False
+
+                elif mode == "combine":
+                    # Combined bicep curls
+                    if (right_hand_angle <= thresholds["bicep_down"] and
+                        left_hand_angle <= thresholds["bicep_down"] and not states["combine"]):
+                        states["combine"] = True
+                        counters["combine"] += 1
+                        speak(f"combine {counters['combine']}")
+                    elif (left_hand_angle >= thresholds["bicep_up"] and
+                          right_hand_angle >= thresholds["bicep_up"] and states["combine"]):
+                        states["combine"] = False
+
+                elif mode == "triceps":
+                    # Tricep extensions - Left
+                    if left_hand_angle > thresholds["tricep_up"] and not states["tricep_push_left"]:
+                        states["tricep_push_left"] = True
+                        counters["left_tricep"] += 1
+                        speak(f"left tricep {counters['left_tricep']}")
+                    elif left_hand_angle < thresholds["tricep_down"] and states["tricep_push_left"]:
+                        states["tricep_push_left"] = False
+
+                    # Tricep extensions - Right
+                    if right_hand_angle > thresholds["tricep_up"] and not states["tricep_push_right"]:
+                        states["tricep_push_right"] = True
+                        counters["right_tricep"] += 1
+                        speak(f"right tricep {counters['right_tricep']}")
+                    elif right_hand_angle < thresholds["tricep_down"] and states["tricep_push_right"]:
+                        states["tricep_push_right"] = False
+
+
+def place_arm(rng, keypoints, joints, angle):
+    # Shoulder, elbow and wrist around a random elbow with the given angle
+    # between the upper arm and the forearm
+    elbow = rng.uniform([150, 120], [570, 360])
+    heading = rng.uniform(0, 2 * np.pi)
+    turn = np.radians(angle) * rng.choice([-1, 1])
+    upper, fore = rng.uniform(60, 120, size=2)
+    keypoints[joints[0]] = elbow + upper * np.array([np.cos(heading), np.sin(heading)])
+    keypoints[joints[1]] = elbow
+    keypoints[joints[2]] = elbow + fore * np.array([np.cos(heading + turn), np.sin(heading + turn)])
+
+
+def place_exact_arm(rng, keypoints, joints):
+    # Whole-pixel arms at exactly 45 or 90 degrees, right on the bicep_down
+    # and tricep_down thresholds, where < and <= part ways
+    elbow = rng.integers([150, 120], [570, 360])
+    size = rng.integers(40, 100)
+    keypoints[joints[0]] = elbow + [size, 0]
+    keypoints[joints[1]] = elbow
+    keypoints[joints[2]] = elbow + ([size, size] if rng.random() < 0.5 else [0, size])
+
+
+def random_frames(rng, count):
+    # Mostly one athlete, sometimes nobody or a few people. Arm angles are
+    # often within a few degrees of a threshold, where truncating keypoints
+    # to whole pixels decides the crossing, and both arms often move
+    # together so combined reps happen too.
+    limits = sorted(set(thresholds.values()))
+    for _ in range(count):
+        people = rng.choice([0, 1, 1, 1, 2, 3])
+        if people == 0:
+            yield None
+            continue
+        keypoints = rng.uniform(0, [720, 480], size=(people, 17, 2))
+        for person in keypoints:
+            if rng.random() < 0.5:
+                left = rng.choice(limits) + rng.uniform(-3, 3)
+            else:
+                left = rng.uniform(0, 180)
+            right = left + rng.uniform(-3, 3) if rng.random() < 0.7 else rng.uniform(0, 180)
+            place_arm(rng, person, (5, 7, 9), np.clip(left, 0, 180))
+            place_arm(rng, person, (6, 8, 10), np.clip(right, 0, 180))
+            if rng.random() < 0.1:
+                place_exact_arm(rng, person, (5, 7, 9))
+                place_exact_arm(rng, person, (6, 8, 10))
+        yield keypoints.astype(np.float32)
+
+
+@pytest.mark.parametrize('mode', ["normal", "combine", "triceps"])
+def test_rep_engine_matches_old_logic(mode):
+    engine = RepEngine(thresholds)
+    old = (new_states(), new_counters(), {"left": 0, "right": 0}, [])
+    new = (new_states(), new_counters(), {"left": 0, "right": 0}, [])
+
+    for keypoints in random_frames(np.random.default_rng(len(mode)), 3000):
+        old_step(mode, old[0], old[1], old[2], keypoints, old[3])
+        angles, events = engine.step(mode, new[0], new[1], keypoints)
+        if angles is not None:
+            new[2].update(left=int(angles["left"]), right=int(angles["right"]))
+        new[3].extend(event.announce for event in events)
+        assert new[:3] == old[:3]
+
+    assert new[3] == old[3]
+    # The frames have to actually exercise the counters
+    assert sum(old[1].values()) > 50
+
+
+def test_rule_hysteresis_widens_the_thresholds():
+    rng = np.random.default_rng(0)
+    # bicep_down 45 and bicep_up 170 become 40 and 175
+    exercises = {"normal": [rule._replace(hysteresis=5) for rule in EXERCISES["normal"]]}
+    engine = RepEngine(thresholds, exercises)
+    states, counters = new_states(), new_counters()
+    counts = []
+    for left in (42, 36, 173, 36, 178, 36):
+        keypoints = rng.uniform(0, [720, 480], size=(1, 17, 2))
+        place_arm(rng, keypoints[0], (5, 7, 9), left)
+        place_arm(rng, keypoints[0], (6, 8, 10), 90)
+        engine.step("normal", states, counters, keypoints.astype(np.float32))
+        counts.append(counters["left_hand"])
+    assert counts == [0, 1, 1, 1, 1, 2]
@@ -0,0 +1,81 @@
+import numpy as np
+
+from smoothing import KeypointSmoother, OneEuroFilter
+
+FPS = 15
+# Fixed body shape: 17 keypoints centred on the origin, scaled and placed per person
+SHAPE = np.random.default_rng(0).uniform(-0.5, 0.5, size=(17, 2))
+SHAPE -= SHAPE.mean(axis=0)
+
+
+def person(rng, center, size=200.0, jitter=4.0):
+    points = np.asarray(center) + SHAPE * size
+    return points + rng.normal(0, jitter, points.shape)
+
+
+def frames(people):
+    return np.stack(people).astype(np.float32)
+
+
+def test_static_pose_jitter_is_reduced():
+    rng = np.random.default_rng(1)
+    smoother = KeypointSmoother()
+    truth = person(rng, (360, 240), jitter=0)
+    raw, smoothed = [], []
+    for i in range(150):
+        observed = truth + rng.normal(0, 4, truth.shape)
+        out = smoother.update(frames([observed]), i / FPS)[0]
+        if i >= 15:
+            raw.append(observed)
+            smoothed.append(out)
+    # Frame-to-frame flicker is what makes joint angles cross thresholds
+    assert np.std(np.diff(smoothed, axis=0)) < 0.75 * np.std(np.diff(raw, axis=0))
+    assert np.abs(np.mean(smoothed, axis=0) - truth).max() < 3
+
+
+def test_fast_motion_keeps_little_lag():
+    # A wrist sweeping 600 px/s, faster than a quick curl at 15 fps
+    filt = OneEuroFilter()
+    lags = []
+    for i in range(45):
+        t = i / FPS
+        x = np.array([[100 + 600 * t, 240.0]])
+        out = filt(x, t)
+        if i >= 5:
+            lags.append(abs(out[0, 0] - x[0, 0]))
+    # Under a tenth of the 40 px the wrist moves between frames
+    assert max(lags) < 4
+
+
+def test_stays_on_athlete_when_bystander_appears():
+    rng = np.random.default_rng(2)
+    smoother = KeypointSmoother()
+    athlete = (300, 260)
+    for i in range(10):
+        smoother.update(frames([person(rng, athlete)]), i / FPS)
+    for i in range(10, 40):
+        # A bigger bystander, listed first, walks into view
+        bystander = person(rng, (560, 220), size=320)
+        out = smoother.update(frames([bystander, person(rng, athlete)]), i / FPS)
+        assert out.shape == (1, 17, 2)
+        assert np.abs(out[0].mean(axis=0) - athlete).max() < 20
+    assert smoother.switches == 0
+
+
+def test_reacquires_athlete_by_iou_after_dropout():
+    rng = np.random.default_rng(3)
+    smoother = KeypointSmoother(max_gap=1.0)
+    athlete = (300, 260)
+    for i in range(10):
+        smoother.update(frames([person(rng, athlete)]), i / FPS)
+    # Nobody detected for half a second
+    for i in range(10, 17):
+        assert len(smoother.update(np.zeros((0, 17, 2), dtype=np.float32), i / FPS)) == 0
+    # Back near the old box, next to a bigger bystander
+    out = smoother.update(frames([person(rng, (560, 220), size=320), person(rng, (310, 262))]), 17 / FPS)
+    assert np.abs(out[0].mean(axis=0) - (310, 262)).max() < 20
+    assert smoother.switches == 0
+
+    # After more than max_gap without frames the largest person is taken
+    out = smoother.update(frames([person(rng, (560, 220), size=320), person(rng, athlete)]), 17 / FPS + 1.5)
+    assert np.abs(out[0].mean(axis=0) - (560, 220)).max() < 20
@@ -0,0 +1,123 @@
+import sys
+import textwrap
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from worker_pool import InferenceWorkerPool
+
+# Spawned workers load their model through model_registry.load_pose_model,
+# which imports ultralytics; a stand-in package on sys.path (spawned
+# processes inherit it) answers with the worker's pid as the keypoints, and
+# sleeps on frames whose first pixel is 255 so a frame can be caught in
+# flight.
+FAKE_ULTRALYTICS = '''
+import os
+import time
+
+import numpy as np
+
+
+class _XY:
+    def __init__(self, xy):
+        self.xy = xy
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.xy
+
+
+class _Keypoints:
+    def __init__(self, xy):
+        self.xy = _XY(xy)
+
+
+class _Result:
+    def __init__(self, frame):
+        self.keypoints = _Keypoints(np.full((1, 17, 2), os.getpid(), dtype=np.float32))
+
+
+class YOLO:
+    def __init__(self, path, task=None):
+        self.overrides = {}
+
+    def predict(self, frames, verbose=False):
+        if not isinstance(frames, list):
+            frames = [frames]
+        if any(frame[0, 0, 0] == 255 for frame in frames):
+            time.sleep(30)
+        return [_Result(frame) for frame in frames]
+'''
+
+
+@pytest.fixture
+def pool(tmp_path):
+    package = tmp_path / 'ultralytics'
+    package.mkdir()
+    (package / '__init__.py').write_text(textwrap.dedent(FAKE_ULTRALYTICS))
+    sys.path.insert(0, str(tmp_path))
+    pool = InferenceWorkerPool(2, 'fake.pt', slots_per_worker=2, threads_per_worker=1)
+    try:
+        assert pool.wait_ready(120)
+        yield pool
+    finally:
+        pool.close()
+        sys.path.remove(str(tmp_path))
+
+
+def frame(value=0):
+    return np.full((480, 720, 3), value, dtype=np.uint8)
+
+
+def pid(result):
+    return int(result.keypoints.xy[0, 0, 0])
+
+
+def test_sessions_stick_to_one_worker(pool):
+    first = {session: pid(pool.submit(session, frame())) for session in ('a', 'b')}
+    # New sessions go to the least loaded worker
+    assert first['a'] != first['b']
+    for _ in range(5):
+        for session in ('a', 'b'):
+            assert pid(pool.submit(session, frame())) == first[session]
+    assert pool.stats()['sessions'] == [1, 1]
+
+
+def test_dead_worker_fails_frames_and_moves_sessions(pool):
+    pids = {session: pid(pool.submit(session, frame())) for session in ('a', 'b')}
+    victim = pool.worker_for('a')
+
+    errors = []
+
+    def stuck_frame():
+        try:
+            pool.submit('a', frame(255), timeout=30)
+        except Exception as e:
+            errors.append((e, time.monotonic()))
+
+    thread = threading.Thread(target=stuck_frame)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not pool.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    killed_at = time.monotonic()
+    pool._processes[victim].kill()
+    thread.join(10)
+
+    # Failed as soon as the death was noticed, not on the 30 s timeout
+    assert len(errors) == 1
+    error, failed_at = errors[0]
+    assert isinstance(error, RuntimeError)
+    assert failed_at - killed_at < 5
+    stats = pool.stats()
+    assert victim in stats['failed']
+    assert stats['ready'] == 1
+    assert stats['in_flight'] == 0
+
+    # The next frame of the session runs on the surviving worker
+    assert pid(pool.submit('a', frame())) == pids['b']
+    assert pool.worker_for('a') != victim
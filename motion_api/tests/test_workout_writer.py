@@ -0,0 +1,128 @@
+import time
+import types
+
+import pytest
+
+import workout_writer
+from workout_writer import WorkoutWriter
+
+
+class NotFound(Exception):
+    pass
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(('set', ref.path, data))
+
+    def update(self, ref, data):
+        self.ops.append(('update', ref.path, data))
+
+    def commit(self):
+        # Atomic like Firestore: all writes land or none do
+        self.db.commits.append(len(self.ops))
+        if self.db.outages:
+            self.db.outages -= 1
+            raise RuntimeError("unavailable")
+        for kind, path, _ in self.ops:
+            if kind == 'update' and path not in self.db.docs:
+                raise NotFound(f"No document to update: {path}")
+        for _, path, data in self.ops:
+            self.db.docs.setdefault(path, {}).update(data)
+
+
+class FakeDb:
+    # In-memory Firestore: the first `outages` commits fail, and updates
+    # to missing documents fail with NotFound
+    def __init__(self, outages=0):
+        self.outages = outages
+        self.commits = []
+        self.docs = {}
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    # Backoff sleeps are recorded instead of slept
+    monkeypatch.setattr(workout_writer, 'time', types.SimpleNamespace(sleep=slept.append, monotonic=time.monotonic))
+    monkeypatch.setattr(workout_writer, 'PERMANENT_ERRORS', (NotFound,))
+    return slept
+
+
+def wait_until(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_commits_full_batches_without_a_flush(sleeps):
+    db = FakeDb()
+    writer = WorkoutWriter(db, max_batch=3, flush_interval=60)
+    for i in range(7):
+        writer.set(FakeRef(f"workouts/{i}"), {'reps': i})
+    wait_until(lambda: writer.committed == 6)
+    assert writer.pending() == 1
+    assert writer.flush(wait=True, timeout=5)
+    assert db.commits == [3, 3, 1]
+    assert (writer.committed, writer.failed) == (7, 0)
+    writer.close()
+
+
+def test_commits_after_flush_interval(sleeps):
+    db = FakeDb()
+    writer = WorkoutWriter(db, flush_interval=0.05)
+    writer.set(FakeRef("workouts/1"), {'reps': 1})
+    wait_until(lambda: writer.committed == 1)
+    writer.close()
+
+
+def test_retries_with_exponential_backoff(sleeps):
+    db = FakeDb(outages=2)
+    writer = WorkoutWriter(db, backoff=0.5)
+    writer.set(FakeRef("workouts/1"), {'reps': 1})
+    writer.set(FakeRef("workouts/2"), {'reps': 2})
+    assert writer.flush(wait=True, timeout=5)
+    assert sleeps == [0.5, 1.0]
+    assert db.commits == [2, 2, 2]
+    assert (writer.committed, writer.failed) == (2, 0)
+    writer.close()
+
+
+def test_bad_write_is_not_retried_and_others_commit(sleeps):
+    db = FakeDb()
+    writer = WorkoutWriter(db)
+    writer.set(FakeRef("workouts/a"), {'reps': 1})
+    writer.update(FakeRef("workouts/missing"), {'reps': 2})
+    writer.set(FakeRef("workouts/b"), {'reps': 3})
+    assert writer.flush(wait=True, timeout=5)
+    # One batch, then one write at a time; NotFound is never retried
+    assert sleeps == []
+    assert db.commits == [3, 1, 1, 1]
+    assert (writer.committed, writer.failed) == (2, 1)
+    assert set(db.docs) == {"workouts/a", "workouts/b"}
+    writer.close()
+
+
+def test_outage_gives_each_write_one_last_try(sleeps):
+    db = FakeDb(outages=100)
+    writer = WorkoutWriter(db, max_retries=2)
+    writer.set(FakeRef("workouts/a"), {'reps': 1})
+    writer.set(FakeRef("workouts/b"), {'reps': 2})
+    assert writer.flush(wait=True, timeout=5)
+    assert len(sleeps) == 2
+    assert db.commits == [2, 2, 2, 1, 1]
+    assert (writer.committed, writer.failed) == (0, 2)
+    writer.close()
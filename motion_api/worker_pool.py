@@ -0,0 +1,299 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends import worker_threads
+from frames import FRAME_HEIGHT, FRAME_WIDTH
+
+# One shared-memory slot holds one resized BGR frame
+SLOT_BYTES = FRAME_WIDTH * FRAME_HEIGHT * 3
+
+
+class _Keypoints:
+    def __init__(self, xy):
+        self.xy = xy
+
+
+class PoseResult:
+    # The part of an ultralytics Results object the pipeline reads, rebuilt
+    # from the keypoint array a worker process sends back
+    def __init__(self, xy):
+        self.keypoints = _Keypoints(xy) if xy is not None else None
+
+
+def _slot_view(buf, slot, shape):
+    return np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=slot * SLOT_BYTES)
+
+
+def _worker_main(index, model_path, imgsz, shm_name, jobs, results, max_batch, threads):
+    # Runs in a spawned process: its own model, on its share of the cores
+    # (OMP_NUM_THREADS covers OpenMP builds of the runtimes, limit_threads
+    # the rest)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    from backends import limit_threads
+    from model_registry import load_pose_model, warm_pose_model
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        model = load_pose_model(model_path, imgsz)
+        warm_pose_model(model)
+        limit_threads(model, model_path, threads)
+        warm_pose_model(model)
+        results.put(('ready', index, None, None))
+    except Exception as e:
+        results.put(('failed', index, None, str(e)))
+        shm.close()
+        return
+
+    while True:
+        batch = [jobs.get()]
+        while batch[-1] is not None and len(batch) < max_batch:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        batch = [job for job in batch if job is not None]
+
+        if batch:
+            # Views straight into shared memory; the front end won't reuse a
+            # slot until its result is back
+            frames = [_slot_view(shm.buf, slot, shape) for _, slot, shape in batch]
+            try:
+                outputs = model.predict(frames, verbose=False)
+                for (job_id, _, _), output in zip(batch, outputs):
+                    xy = output.keypoints.xy.cpu().numpy() if output.keypoints is not None else None
+                    results.put(('result', job_id, xy, None))
+            except Exception as e:
+                for job_id, _, _ in batch:
+                    results.put(('result', job_id, None, str(e)))
+            del frames
+        if stop:
+            break
+    shm.close()
+
+
+class _Job:
+    def __init__(self, worker, slot):
+        self.worker = worker
+        self.slot = slot
+        self.xy = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceWorkerPool:
+    # Pose inference in N worker processes, each with its own model, so
+    # inference uses every core instead of one GIL-bound interpreter.
+    # Frames are copied once into a shared-memory slot owned by the chosen
+    # worker; only (job id, slot, shape) and the keypoint array are pickled.
+    # A session sticks to one worker for its lifetime, which keeps its
+    # frames in order on one model. A worker that dies fails its frames in
+    # flight and its sessions move to the remaining workers. model_path may
+    # be an exported artifact (see backends.py); imgsz overrides the
+    # inference size.
+    def __init__(self, workers=None, model_path="./yolo11n-pose.pt", slots_per_worker=8,
+                 max_batch=4, threads_per_worker=None, start_timeout=300, imgsz=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.slots_per_worker = slots_per_worker
+        self.start_timeout = start_timeout
+        threads = threads_per_worker or worker_threads(self.workers)
+        ctx = mp.get_context('spawn')
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self.workers * slots_per_worker * SLOT_BYTES)
+        self.results = ctx.Queue()
+        self.frames = [0] * self.workers
+        self.failed = {}
+        self._jobs = [ctx.Queue() for _ in range(self.workers)]
+        self._free = [list(range(w * slots_per_worker, (w + 1) * slots_per_worker)) for w in range(self.workers)]
+        self._slot_cond = threading.Condition()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._affinity = {}
+        self._lock = threading.Lock()
+        self._ready = set()
+        self._dead = set()
+        self._ready_cond = threading.Condition()
+        self._closed = False
+
+        self._processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(w, model_path, imgsz, self.shm.name, self._jobs[w], self.results, max_batch, threads),
+                name=f"pose-worker-{w}",
+                daemon=True,
+            )
+            for w in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, name="pose-pool-results", daemon=True)
+        self._collector.start()
+
+    def wait_ready(self, timeout=None):
+        deadline = time.monotonic() + (self.start_timeout if timeout is None else timeout)
+        with self._ready_cond:
+            while len(self._ready) + len(self.failed) < self.workers:
+                # Died before it could report, e.g. on import errors
+                self._check_workers()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._ready_cond.wait(min(remaining, 0.5))
+            return not self.failed
+
+    def worker_for(self, session_id):
+        # New sessions go to the worker with the fewest sessions
+        with self._lock:
+            worker = self._affinity.get(session_id)
+            if worker is None or worker in self._dead:
+                live = [w for w in range(self.workers) if w not in self.failed]
+                if not live:
+                    raise RuntimeError("No pose workers left")
+                loads = [0] * self.workers
+                for w in self._affinity.values():
+                    loads[w] += 1
+                worker = min([w for w in live if w in self._ready] or live, key=lambda w: loads[w])
+                self._affinity[session_id] = worker
+            return worker
+
+    def release(self, session_id):
+        with self._lock:
+            self._affinity.pop(session_id, None)
+
+    def submit(self, session_id, frame, timeout=30):
+        if frame.nbytes > SLOT_BYTES:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {SLOT_BYTES} byte slot")
+        while True:
+            worker = self.worker_for(session_id)
+            with self._slot_cond:
+                if not self._slot_cond.wait_for(
+                        lambda: self._free[worker] or self._closed or worker in self._dead, timeout):
+                    raise TimeoutError("Pose inference timed out")
+                if self._closed:
+                    raise RuntimeError("Inference worker pool is closed")
+                if worker in self._dead:
+                    # Died while we waited; the session moves on next pass
+                    continue
+                slot = self._free[worker].pop()
+                break
+
+        job_id = next(self._ids)
+        job = _Job(worker, slot)
+        _slot_view(self.shm.buf, slot, frame.shape)[...] = frame
+        with self._lock:
+            if worker in self._dead:
+                raise RuntimeError(f"Pose worker {worker} stopped")
+            self._pending[job_id] = job
+        self._jobs[worker].put((job_id, slot, frame.shape))
+
+        if not job.done.wait(timeout):
+            # The slot stays taken until the worker answers (or is found dead)
+            raise TimeoutError("Pose inference timed out")
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return PoseResult(job.xy)
+
+    def stats(self):
+        with self._lock:
+            sessions = [0] * self.workers
+            for w in self._affinity.values():
+                sessions[w] += 1
+            in_flight = len(self._pending)
+        return {
+            'workers': self.workers,
+            'ready': len(self._ready),
+            'failed': dict(self.failed),
+            'sessions': sessions,
+            'frames': list(self.frames),
+            'in_flight': in_flight,
+        }
+
+    def close(self, timeout=10):
+        with self._slot_cond:
+            self._closed = True
+            self._slot_cond.notify_all()
+        for jobs in self._jobs:
+            jobs.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self.results.put(('closed', None, None, None))
+        self._collector.join(timeout)
+        self.shm.close()
+        self.shm.unlink()
+
+    def _check_workers(self):
+        if self._closed:
+            return
+        for w, process in enumerate(self._processes):
+            if w not in self._dead and not process.is_alive():
+                print(f"Pose worker {w} exited with code {process.exitcode}")
+                self._worker_died(w, f"exited with code {process.exitcode}")
+
+    def _worker_died(self, w, reason):
+        # Fails its frames in flight right away instead of on the submit
+        # timeout; its slots are never handed out again
+        with self._ready_cond:
+            if w in self._dead:
+                return
+            self._dead.add(w)
+            self._ready.discard(w)
+            self.failed.setdefault(w, reason)
+            self._ready_cond.notify_all()
+        with self._lock:
+            for session_id in [s for s, worker in self._affinity.items() if worker == w]:
+                del self._affinity[session_id]
+            jobs = [job_id for job_id, job in self._pending.items() if job.worker == w]
+            jobs = [self._pending.pop(job_id) for job_id in jobs]
+        for job in jobs:
+            job.error = f"Pose worker {w} {reason}"
+            job.done.set()
+        with self._slot_cond:
+            self._slot_cond.notify_all()
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                kind, key, xy, error = self.results.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+            # A crashed or OOM-killed worker never answers, so look for
+            # dead processes every half second
+            if time.monotonic() - last_check >= 0.5:
+                last_check = time.monotonic()
+                self._check_workers()
+            if kind is None:
+                continue
+            if kind == 'closed':
+                return
+            if kind == 'ready':
+                with self._ready_cond:
+                    if key not in self._dead:
+                        self._ready.add(key)
+                    self._ready_cond.notify_all()
+                continue
+            if kind == 'failed':
+                print(f"Pose worker {key} failed to start: {error}")
+                self._worker_died(key, error)
+                continue
+
+            with self._lock:
+                job = self._pending.pop(key, None)
+            if job is None:
+                continue
+            job.xy, job.error = xy, error
+            self.frames[job.worker] += 1
+            with self._slot_cond:
+                self._free[job.worker].append(job.slot)
+                self._slot_cond.notify_all()
+            job.done.set()
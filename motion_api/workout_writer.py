@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+try:
+    # Errors no retry can fix, e.g. an update to a workout that was never created
+    from google.api_core.exceptions import InvalidArgument, NotFound
+    PERMANENT_ERRORS = (InvalidArgument, NotFound)
+except ImportError:
+    PERMANENT_ERRORS = ()
+
+
+class WorkoutWriter:
+    # Write-behind buffer for workout documents and per-rep events. Request
+    # threads only enqueue writes; a background thread commits them as
+    # Firestore batches once max_batch writes are waiting, flush_interval
+    # seconds have passed, or flush() is called. Failed commits are retried
+    # with exponential backoff, except for errors that can never succeed;
+    # a batch that still fails is committed one write at a time, so one bad
+    # write doesn't take other sessions' writes down with it. Works with
+    # anything that has a Firestore-style batch() (set/update/commit), e.g.
+    # the emulator client.
+    def __init__(self, db, max_batch=200, flush_interval=2.0, max_pending=10000,
+                 max_retries=5, backoff=0.5, put_timeout=1.0):
+        self.db = db
+        self.max_batch = min(max_batch, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.put_timeout = put_timeout
+        self.committed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._ops = deque()
+        self._enqueued = 0
+        self._processed = 0
+        self._flush_requested = False
+        self._callbacks = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="workout-writer", daemon=True)
+        self._thread.start()
+
+    def set(self, ref, data, merge=False):
+        self._enqueue(('set', ref, data, merge))
+
+    def update(self, ref, data):
+        self._enqueue(('update', ref, data, False))
+
+    def pending(self):
+        with self._cond:
+            return len(self._ops)
+
+    def flush(self, wait=False, timeout=None, callback=None):
+        # Commit everything queued so far; with wait=True, block until done.
+        # `callback` runs on the writer thread once those writes are through
+        # (committed or given up on).
+        with self._cond:
+            target = self._enqueued
+            if callback is not None:
+                self._callbacks.append((target, callback))
+            self._flush_requested = True
+            self._cond.notify_all()
+            if wait:
+                return self._cond.wait_for(lambda: self._processed >= target, timeout)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(wait=True, timeout=timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _enqueue(self, op):
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._ops) >= self.max_pending:
+                # Give the writer a moment to drain before giving up on the write
+                if not self._cond.wait_for(lambda: len(self._ops) < self.max_pending, self.put_timeout):
+                    self.dropped += 1
+                    print(f"Workout writer queue full, dropping {op[0]} on {op[1].path}")
+                    return
+            self._ops.append(op)
+            self._enqueued += 1
+            if len(self._ops) >= self.max_batch:
+                self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closed and not self._flush_requested and len(self._ops) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._ops.popleft() for _ in range(min(len(self._ops), self.max_batch))]
+            if not self._ops:
+                self._flush_requested = False
+            if not batch and self._closed:
+                return None
+            # Wakes writers waiting for queue space
+            self._cond.notify_all()
+            return batch
+
+    def _commit(self, ops):
+        error = self._try_commit(ops, self.max_retries)
+        if error is None:
+            self.committed += len(ops)
+            return
+        if len(ops) == 1:
+            self.failed += 1
+            print(f"Error writing workout update to {ops[0][1].path}: {error}")
+            return
+        # Batches are atomic, so find the writes that can still land. When
+        # the batch already used up its retries only one more try each.
+        retries = self.max_retries if isinstance(error, PERMANENT_ERRORS) else 0
+        for op in ops:
+            error = self._try_commit([op], retries)
+            if error is None:
+                self.committed += 1
+            else:
+                self.failed += 1
+                print(f"Error writing workout update to {op[1].path}: {error}")
+
+    def _try_commit(self, ops, retries):
+        # Returns None on success, else the last error
+        for attempt in range(retries + 1):
+            try:
+                batch = self.db.batch()
+                for kind, ref, data, merge in ops:
+                    if kind == 'set':
+                        batch.set(ref, data, merge=merge)
+                    else:
+                        batch.update(ref, data)
+                batch.commit()
+                return None
+            except Exception as e:
+                if attempt == retries or isinstance(e, PERMANENT_ERRORS):
+                    return e
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._commit(batch)
+            with self._cond:
+                self._processed += len(batch)
+                done = [cb for target, cb in self._callbacks if target <= self._processed]
+                self._callbacks = [(target, cb) for target, cb in self._callbacks if target > self._processed]
+                self._cond.notify_all()
+            for callback in done:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error in workout writer callback: {e}")